@@ -0,0 +1,133 @@
+"""
+Synthetic sketches for the benchmarks in the format of logic.sketch.Sketch.to_dict.
+Every generator takes the approximate number of points, the coordinates are a consistent
+configuration with random noise, so that the solver has to move every point.
+"""
+import numpy as np
+
+NOISE = 0.05
+LENGTH = 10.
+HEXAGON_SIDES = 6
+LATTICE_POINTS_ON_LINE = 8
+
+
+class SketchBuilder:
+    def __init__(self, seed):
+        self.random = np.random.RandomState(seed)
+        self.points = []
+        self.lines = []
+        self.constraints = []
+
+    def add_point(self, x, y):
+        noise = self.random.uniform(-NOISE, NOISE, 2) * LENGTH
+        self.points.append({'id': len(self.points), 'x': float(x + noise[0]), 'y': float(y + noise[1])})
+        return len(self.points) - 1
+
+    def add_line(self, x1, y1, x2, y2):
+        p1_id = self.add_point(x1, y1)
+        p2_id = self.add_point(x2, y2)
+        self.lines.append({'id': len(self.lines), 'p1_id': p1_id, 'p2_id': p2_id})
+        return len(self.lines) - 1
+
+    def add_constraint(self, name, objects, value=None):
+        objects = [{'type': obj_type, 'obj': obj_id} for obj_type, obj_id in objects]
+        self.constraints.append({'id': len(self.constraints), 'name': name, 'objects': objects, 'value': value})
+
+    def coincide(self, p1_id, p2_id):
+        self.add_constraint('points_coincidence_constraint', [('point', p1_id), ('point', p2_id)])
+
+    def line_length(self, line_id, length):
+        line = self.lines[line_id]
+        self.add_constraint('points_dist_constraint', [('point', line['p1_id']), ('point', line['p2_id'])], length)
+
+    def to_dict(self):
+        return {'points': self.points, 'lines': self.lines, 'constraints': self.constraints}
+
+
+def chain(points_num, seed=0):
+    """
+    Staircase of lines joined by coincident ends, horizontal and vertical in turn, with lengths.
+    """
+    builder = SketchBuilder(seed)
+    x, y = 0., 0.
+    for i in range(max(points_num // 2, 1)):
+        dx, dy = (LENGTH, 0.) if i % 2 == 0 else (0., LENGTH)
+        line_id = builder.add_line(x, y, x + dx, y + dy)
+        builder.add_constraint('horizontal_constraint' if i % 2 == 0 else 'vertical_constraint', [('line', line_id)])
+        builder.line_length(line_id, LENGTH)
+        if i > 0:
+            builder.coincide(builder.lines[line_id - 1]['p2_id'], builder.lines[line_id]['p1_id'])
+        x, y = x + dx, y + dy
+    return builder.to_dict()
+
+
+def grid(points_num, seed=0):
+    """
+    k x k nodes joined by lines of fixed length, the ends of the lines meeting in a node coincide.
+    Only the lines of the first row and of the first column are horizontal and vertical,
+    the other cells are held by the lengths alone and may shear, the solver keeps the nearest shape.
+    """
+    builder = SketchBuilder(seed)
+    # 2 k (k - 1) lines, 2 points each
+    k = max(int(round((1 + np.sqrt(1 + points_num)) / 2)), 2)
+    nodes = {}
+    for i in range(k):
+        for j in range(k):
+            for di, dj, name in ((0, 1, 'horizontal_constraint'), (1, 0, 'vertical_constraint')):
+                if i + di >= k or j + dj >= k:
+                    continue
+                line_id = builder.add_line(j * LENGTH, i * LENGTH, (j + dj) * LENGTH, (i + di) * LENGTH)
+                # направления всех линий вместе с длинами избыточны: каждая строка задавала бы те же расстояния
+                if (i == 0 and di == 0) or (j == 0 and dj == 0):
+                    builder.add_constraint(name, [('line', line_id)])
+                builder.line_length(line_id, LENGTH)
+                nodes.setdefault((i, j), []).append(builder.lines[line_id]['p1_id'])
+                nodes.setdefault((i + di, j + dj), []).append(builder.lines[line_id]['p2_id'])
+    for point_ids in nodes.values():
+        for p1_id, p2_id in zip(point_ids, point_ids[1:]):
+            builder.coincide(p1_id, p2_id)
+    return builder.to_dict()
+
+
+def polygons(points_num, seed=0):
+    """
+    Hexagons with the lengths of all sides and the angles of all corners but three.
+    """
+    builder = SketchBuilder(seed)
+    angles = np.arange(HEXAGON_SIDES + 1) * 2 * np.pi / HEXAGON_SIDES
+    for polygon in range(max(points_num // (2 * HEXAGON_SIDES), 1)):
+        xs = polygon * 3 * LENGTH + LENGTH * np.cos(angles)
+        ys = LENGTH * np.sin(angles)
+        line_ids = [builder.add_line(xs[i], ys[i], xs[i + 1], ys[i + 1]) for i in range(HEXAGON_SIDES)]
+        for i, line_id in enumerate(line_ids):
+            builder.line_length(line_id, LENGTH)
+            next_id = line_ids[(i + 1) % HEXAGON_SIDES]
+            builder.coincide(builder.lines[line_id]['p2_id'], builder.lines[next_id]['p1_id'])
+            if i < HEXAGON_SIDES - 3:
+                builder.add_constraint('angle_constraint', [('line', line_id), ('line', next_id)],
+                                       360. / HEXAGON_SIDES)
+    return builder.to_dict()
+
+
+def lattice(points_num, seed=0):
+    """
+    Horizontal lines of fixed length with free points lying on them.
+    """
+    builder = SketchBuilder(seed)
+    length = LENGTH * (LATTICE_POINTS_ON_LINE + 1)
+    for row in range(max(points_num // (LATTICE_POINTS_ON_LINE + 2), 1)):
+        line_id = builder.add_line(0., row * LENGTH, length, row * LENGTH)
+        builder.add_constraint('horizontal_constraint', [('line', line_id)])
+        builder.line_length(line_id, length)
+        for i in range(LATTICE_POINTS_ON_LINE):
+            point_id = builder.add_point((i + 1) * LENGTH, row * LENGTH)
+            builder.add_constraint('point_belongs_line_constraint', [('line', line_id), ('point', point_id)])
+    return builder.to_dict()
+
+
+GENERATORS = {
+    'chain': chain,
+    'grid': grid,
+    'polygons': polygons,
+    'lattice': lattice,
+}
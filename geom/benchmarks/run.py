@@ -0,0 +1,170 @@
+"""
+Benchmarks of the constraint solver on the synthetic sketches of benchmarks.generators:
+
+    python -m benchmarks.run -o results.json
+    python -m benchmarks.run --cases chain grid --sizes 10 100 --repeat 3
+
+For every case and size the sketch is solved from scratch three times:
+- recalculate_point_positions as is, for the total time;
+- the same with a telemetry monitor, to split the time into compiling the system, assembling J and F
+  (get_jf_func) and the rest of newtons_method, which is the linear solves, and to count the iterations;
+- recalculate_point_positions under tracemalloc, for the peak memory.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.generators import GENERATORS
+from logic.constraints import recalculate_point_positions
+from logic.graph import get_constraint_graph
+from logic.linalg import AUTO, DENSE, SPARSE, import_scipy
+from logic.newton import DEFAULT_STRATEGY, STRATEGIES
+from logic.sketch import Sketch
+from logic.system import get_compiled_system
+from logic.telemetry import ITERATION_END, NEWTON_END, SYSTEM, RingBuffer
+
+SIZES = (10, 100, 1000, 10000)
+
+
+def load_sketch(data):
+    sketch = Sketch()
+    sketch.load(data)
+    return sketch
+
+
+def get_residual(storage):
+    # max |g| of all constraints at the current coordinates
+    residual = 0.
+    for constraint_ids in get_constraint_graph(storage).get_components():
+        system = get_compiled_system(storage, constraint_ids=constraint_ids)
+        coords_vector = system.get_coords(storage)
+        if len(system.point_rows):
+            # линейные ограничения - отклонение координат от значения своей переменной
+            coords = storage.points.coords[system.point_rows]
+            var_coords = coords_vector[system.lam_num:][system.coord_vars]
+            residual = max(residual, float(np.abs(coords - var_coords).max()))
+        for batch in system.batches:
+            residual = max(residual, float(np.abs(batch.evaluate(coords_vector)[0]).max()))
+    return residual
+
+
+def run_total(data, backend, strategy):
+    storage = load_sketch(data).storage
+    start = time.perf_counter()
+    recalculate_point_positions(storage, backend=backend, strategy=strategy)
+    return time.perf_counter() - start, get_residual(storage)
+
+
+def run_phases(data, backend, strategy):
+    storage = load_sketch(data).storage
+    # компиляция отдельно, чтобы её время не попало в итерации
+    start = time.perf_counter()
+    for constraint_ids in get_constraint_graph(storage).get_components():
+        get_compiled_system(storage, backend, constraint_ids)
+    compile_time = time.perf_counter() - start
+
+    monitor = RingBuffer(maxlen=None)
+    recalculate_point_positions(storage, backend=backend, strategy=strategy, workers=1, monitor=monitor)
+    systems = monitor.get_events(SYSTEM)
+    iterations = monitor.get_events(ITERATION_END)
+    newton_ends = monitor.get_events(NEWTON_END)
+    return {
+        'components': len(systems),
+        'unknowns': sum(system['size'] for system in systems),
+        'nnz': sum(system['nnz'] for system in systems),
+        'compile_s': compile_time,
+        'assembly_s': sum(iteration['assembly_s'] for iteration in iterations),
+        'linear_solve_s': sum(iteration['solve_s'] for iteration in iterations),
+        'iterations': len(iterations),
+        'max_component_iterations': max([end['iterations'] for end in newton_ends], default=0),
+    }
+
+
+def run_memory(data, backend, strategy):
+    storage = load_sketch(data).storage
+    tracemalloc.start()
+    try:
+        recalculate_point_positions(storage, backend=backend, strategy=strategy)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_case(name, size, backend=AUTO, strategy=DEFAULT_STRATEGY, repeat=1):
+    data = GENERATORS[name](size)
+    result = {
+        'case': name,
+        'size': size,
+        'points': len(data['points']),
+        'constraints': len(data['constraints']),
+        'backend': backend,
+        'strategy': strategy,
+        'error': None,
+    }
+    try:
+        totals = [run_total(data, backend, strategy) for _ in range(repeat)]
+        phases = [run_phases(data, backend, strategy) for _ in range(repeat)]
+        result['peak_memory_bytes'] = run_memory(data, backend, strategy)
+    except RuntimeError as e:
+        result['error'] = str(e)
+        return result
+    result['total_s'] = min(total for total, residual in totals)
+    result['residual'] = totals[0][1]
+    result.update(min(phases, key=lambda phase: phase['compile_s'] + phase['assembly_s'] + phase['linear_solve_s']))
+    return result
+
+
+def get_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Benchmark the constraint solver')
+    parser.add_argument('--cases', nargs='+', choices=sorted(GENERATORS), default=sorted(GENERATORS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES, help='approximate numbers of points')
+    parser.add_argument('--backend', choices=(AUTO, DENSE, SPARSE), default=AUTO)
+    parser.add_argument('--strategy', choices=sorted(STRATEGIES), default=DEFAULT_STRATEGY)
+    parser.add_argument('--repeat', type=int, default=1, help='the best of several runs is reported')
+    parser.add_argument('-o', '--output', help='result JSON file, stdout by default')
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    # scipy импортируется при первом разреженном решении, не включаем это в замеры
+    import_scipy()
+    results = []
+    for name in args.cases:
+        for size in args.sizes:
+            result = run_case(name, size, args.backend, args.strategy, args.repeat)
+            results.append(result)
+            print('{case:>10} {points:>6} points: {summary}'.format(
+                summary=result['error'] or '{total_s:.4f} s, {iterations} iterations'.format(**result), **result),
+                file=sys.stderr)
+
+    report = json.dumps({
+        'revision': get_revision(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
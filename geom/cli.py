@@ -0,0 +1,61 @@
+"""
+Solves a sketch without the GUI:
+
+    python cli.py sketch.json -o solved.json
+
+The sketch file is the JSON of logic.sketch.Sketch.to_dict:
+{"points": [{"id": 0, "x": 0.0, "y": 0.0}, ...],
+ "lines": [{"id": 0, "p1_id": 0, "p2_id": 1}, ...],
+ "constraints": [{"name": "horizontal_constraint", "objects": [{"type": "line", "obj": 0}], "value": null}, ...]}
+The result has the same format and ids, with the solved coordinates of the points.
+"""
+import argparse
+import json
+import sys
+
+from logic.linalg import AUTO, DENSE, SPARSE
+from logic.newton import DEFAULT_STRATEGY, STRATEGIES
+from logic.sketch import Sketch
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Solve the constraints of a sketch')
+    parser.add_argument('sketch', help='sketch JSON file, - for stdin')
+    parser.add_argument('-c', '--constraints', help='JSON file with a list of constraints to apply to the sketch')
+    parser.add_argument('-o', '--output', help='result JSON file, stdout by default')
+    parser.add_argument('--backend', choices=(AUTO, DENSE, SPARSE), default=AUTO)
+    parser.add_argument('--strategy', choices=sorted(STRATEGIES), default=DEFAULT_STRATEGY)
+    return parser
+
+
+def read_json(path):
+    if path == '-':
+        return json.load(sys.stdin)
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    sketch = Sketch()
+    try:
+        data = read_json(args.sketch)
+        if args.constraints:
+            data = dict(data, constraints=data.get('constraints', []) + read_json(args.constraints))
+        ids = sketch.load(data)
+        sketch.solve(backend=args.backend, strategy=args.strategy)
+    except (OSError, KeyError, ValueError, RuntimeError) as e:
+        print('error: {}'.format(e), file=sys.stderr)
+        return 1
+
+    result = json.dumps(sketch.to_dict(ids), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(result)
+    else:
+        print(result)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
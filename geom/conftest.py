@@ -0,0 +1 @@
+# каталог geom попадает в sys.path, тесты импортируют модули так же, как приложение (logic.x, storage)
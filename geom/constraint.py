@@ -7,6 +7,26 @@ NAME_TEXT_MAPPING = {
     'horizontal_constraint': 'Горизонтальность',
     'vertical_constraint': 'Вертикальность',
     'point_belongs_line_constraint': 'Принадлежность точки линии',
+    'fix_point_constraint': 'Закрепление точки',
+}
+# индекс имени хранится в storage.ConstraintStore.kind
+CONSTRAINT_NAMES = tuple(NAME_TEXT_MAPPING)
+COINCIDENCE = 'points_coincidence_constraint'
+FIX_POINT = 'fix_point_constraint'
+# линейные ограничения решатель не решает уравнениями, а подставляет до метода Ньютона:
+# связанные координаты точек (0 - x, 1 - y) становятся одной переменной, закреплённые - постоянными
+LINKED_AXES = {
+    COINCIDENCE: (0, 1),
+    'horizontal_constraint': (1,),
+    'vertical_constraint': (0,),
+}
+LINEAR_CONSTRAINTS = set(LINKED_AXES) | {FIX_POINT}
+# ограничения, не зависящие от порядка объектов: одинаковые с точностью до порядка - дубликаты
+SYMMETRIC_CONSTRAINTS = {
+    'points_coincidence_constraint',
+    'points_dist_constraint',
+    'parallel_constraint',
+    'perpendicular_constraint',
 }
 
 
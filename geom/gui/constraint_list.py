@@ -21,6 +21,8 @@ class ConstraintList(QGroupBox):
             'add_constraint': self.on_new_constraint,
             'delete_constraint': self.on_constraint_delete,
             'delete_line': self.on_line_delete,
+            'delete_lines': self.on_line_delete,
+            'batch': self.on_batch,
         }
 
         self.storage = storage.Storage()
@@ -143,6 +145,13 @@ class ConstraintList(QGroupBox):
         self.constraints[constraint_id] = constraint_widget
         self.list_widget.addItem(constraint_widget)
 
+    def on_batch(self, params):
+        # ограничения, добавленные и удалённые задачами пакета
+        for result in params.get('results', []):
+            method = self.result_handling_mapping.get(result.name)
+            if method is not None:
+                method(result.params)
+
     def set_blocked(self, event):
         blocked = event.params.get('is_set')
         if blocked is None:
@@ -159,5 +168,5 @@ class ConstraintList(QGroupBox):
     def can_handle(self, event):
         if event.name == 'task_done':
             result = event.params.get('result')
-            return result.name in {'add_constraint', 'delete_constraint', 'delete_line'}
+            return result.name in self.result_handling_mapping
         return event.name in self.handled_events
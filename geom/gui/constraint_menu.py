@@ -11,7 +11,6 @@ from gui.event_bus import Event
 
 class ConstraintMenu(QGroupBox):
     COLS_NUM = 4
-    ROWS_NUM = 2
     NAMES = [
         'points_coincidence_constraint',
         'points_dist_constraint',
@@ -20,7 +19,8 @@ class ConstraintMenu(QGroupBox):
         'angle_constraint',
         'horizontal_constraint',
         'vertical_constraint',
-        'point_belongs_line_constraint'
+        'point_belongs_line_constraint',
+        'fix_point_constraint',
     ]
 
     FILES = [
@@ -31,7 +31,8 @@ class ConstraintMenu(QGroupBox):
         'icons/angle.png',
         'icons/horizontal.png',
         'icons/vertical.png',
-        'icons/point_belong_line.png'
+        'icons/point_belong_line.png',
+        'icons/fix_point.png',
     ]
 
     TOOLTIPS = [
@@ -42,11 +43,13 @@ class ConstraintMenu(QGroupBox):
         'Задание угла',
         'Горизонтальность',
         'Вертикальность',
-        'Принадлежность точки прямой отрезка'
+        'Принадлежность точки прямой отрезка',
+        'Закрепление точки',
     ]
     LINE = 10
     POINT = 1
     # possible variants:
+    # 1 point (fix point)
     # 2 points (2 points coincidence, 2 points distance)
     # 2 lines (parallel, perpendicular, angle between 2 lines)
     # 1 line (vertical, horizontal)
@@ -54,7 +57,9 @@ class ConstraintMenu(QGroupBox):
 
     CONSTRAINTS_MAPPING = {
         0: set(),
-        POINT * 1: set(),
+        POINT * 1: {
+            'fix_point_constraint',
+        },
         POINT * 2: {
             'points_coincidence_constraint',
             'points_dist_constraint',
@@ -120,10 +125,8 @@ class ConstraintMenu(QGroupBox):
         self.grid = QGridLayout()
         self.grid.addWidget(self.label, 0, 0, 1, 4)
 
-        for i in range(self.ROWS_NUM):
-            for j in range(self.COLS_NUM):
-                name = self.NAMES[i * self.COLS_NUM + j]
-                self.grid.addWidget(self.constraints_dict[name], 1 + i, j)
+        for i, name in enumerate(self.NAMES):
+            self.grid.addWidget(self.constraints_dict[name], 1 + i // self.COLS_NUM, i % self.COLS_NUM)
 
         self.setLayout(self.grid)
 
@@ -14,7 +14,7 @@ class Drawing(QWidget):
         self.event_bus = event_bus
         self.event_bus.register(self)
         self.handled_events = {'mode_changed', 'task_done', 'block', 'clicked_constraint', 'highlight_constraint',
-                               'error', 'cancel'}
+                               'error', 'cancel', 'dof_changed'}
 
         self.init_ui()
         self.methods_mapping = {
@@ -24,7 +24,8 @@ class Drawing(QWidget):
             'clicked_constraint': self.graphics_view.on_constraint_clicked,
             'highlight_constraint': self.graphics_view.highlight_constraint,
             'error': self.on_error,
-            'cancel': self.on_cancel
+            'cancel': self.on_cancel,
+            'dof_changed': self.handle_dof_changed
         }
 
     def init_ui(self):
@@ -33,23 +34,15 @@ class Drawing(QWidget):
         self.mode_lbl.setAlignment(Qt.AlignTop | Qt.AlignRight)
         self.vbox.addWidget(self.mode_lbl)
 
-        # todo:uncomment when (if) this processing is done
-        # self.constraints_number_lbl = QLabel('Эскиз полностью определен')
-        # self.constraints_number_lbl.setAlignment(Qt.AlignBottom | Qt.AlignRight)
-        # self.vbox.addWidget(self.constraints_number_lbl)
-
         self.graphics_view = GraphicsView(self.event_bus)
         self.vbox.addWidget(self.graphics_view)
 
-        self.setLayout(self.vbox)
-
-    def enable_processing(func):
-        def wrapper(self, *args, **kwargs):
-            ret_val = func(self, *args, **kwargs)
-            self.event_bus.dispatch(Event('block', is_set=False))
-            return ret_val
+        # пустой эскиз определен полностью, дальше надпись обновляется по dof_changed
+        self.constraints_number_lbl = QLabel('Эскиз полностью определен')
+        self.constraints_number_lbl.setAlignment(Qt.AlignBottom | Qt.AlignRight)
+        self.vbox.addWidget(self.constraints_number_lbl)
 
-        return wrapper
+        self.setLayout(self.vbox)
 
     def process_if_enabled(func):
         def wrapper(self, *args, **kwargs):
@@ -89,12 +82,27 @@ class Drawing(QWidget):
         self.mode_lbl.setText('Режим: {}'.format(MODES[mode]))
         self.graphics_view.set_handler(mode)
 
-    @enable_processing
     def handle_task_done(self, task):
         result = task.params.get('result', None)
         if result is None:
             raise RuntimeError('drawing: handling task result, result is empty')
         self.graphics_view.on_task_done(result)
+        # сцену блокирует итоговое перемещение, а не кадры перетаскивания: кадр, прерванный им,
+        # тоже приходит сюда, но итоговое перемещение ещё решается
+        if not result.drag:
+            self.event_bus.dispatch(Event('block', is_set=False))
+
+    def handle_dof_changed(self, event):
+        dof = event.params.get('dof')
+        if dof is None:
+            raise RuntimeError('drawing: handling dof, dof is empty')
+        if dof['fully_defined']:
+            text = 'Эскиз полностью определен'
+        else:
+            text = 'Степеней свободы: {}'.format(dof['dof'])
+            if dof['redundant_num']:
+                text += ', избыточных ограничений: {}'.format(dof['redundant_num'])
+        self.constraints_number_lbl.setText(text)
 
     def set_blocked(self, event):
         blocked = event.params.get('is_set')
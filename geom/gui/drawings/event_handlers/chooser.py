@@ -1,7 +1,3 @@
-from PyQt5.QtGui import QTransform
-from PyQt5.QtWidgets import QGraphicsEllipseItem
-
-
 from gui.drawings.event_handlers.drawing_event_handler import EventHandler
 
 
@@ -15,12 +11,11 @@ class Chooser(EventHandler):
 
     def handle_mouse_pressed(self, event):
         pos = self.drawing.mapToScene(event.pos())
-        item = self.drawing.scene().itemAt(pos, QTransform())
-        item_type = 'point'
-        if item is None or 'id' not in item.__dict__:
+        picked = self.drawing.pick(pos)
+        if picked is None:
             return
-        item_type = 'point' if isinstance(item, QGraphicsEllipseItem) else 'line'
-        self.drawing.add_new_constraint_object(item.id, item_type, item)
+        item_type, item_id, item = picked
+        self.drawing.add_new_constraint_object(item_id, item_type, item)
 
     def handle_mouse_released(self, event):
         pass
@@ -1,26 +1,53 @@
-from PyQt5.QtGui import QTransform
-from PyQt5.QtWidgets import QGraphicsLineItem
+from PyQt5.QtCore import QRectF, Qt
+from PyQt5.QtGui import QPen
 
 from gui.drawings.event_handlers.drawing_event_handler import EventHandler
 
 
 class Deleter(EventHandler):
+    """
+    A click deletes the line under the cursor, a rectangle dragged with the left button -
+    all lines inside it.
+    """
+
     def __init__(self, drawing):
         EventHandler.__init__(self)
         self.drawing = drawing
+        self.start = None
+        self.band = None
 
     def handle_mouse_moved(self, event):
-        pass
+        if self.start is None or not event.buttons() & Qt.LeftButton:
+            return
+        rect = QRectF(self.start, self.drawing.mapToScene(event.pos())).normalized()
+        if self.band is None:
+            self.band = self.drawing.scene().addRect(rect, QPen(Qt.gray, 1, Qt.DashLine))
+        else:
+            self.band.setRect(rect)
 
     def handle_mouse_pressed(self, event):
-        pos = self.drawing.mapToScene(event.pos())
-        item = self.drawing.scene().itemAt(pos, QTransform())
-        if not isinstance(item, QGraphicsLineItem) or 'id' not in item.__dict__:
-            return
-        self.drawing.launch_delete_line(item.id)
+        if event.button() == Qt.LeftButton:
+            self.start = self.drawing.mapToScene(event.pos())
 
     def handle_mouse_released(self, event):
-        pass
+        if self.start is None:
+            return
+        end = self.drawing.mapToScene(event.pos())
+        start, self.start = self.start, None
+        if self.band is not None:
+            self.drawing.scene().removeItem(self.band)
+            self.band = None
+        # прямоугольник меньше радиуса захвата считаем щелчком
+        radius = self.drawing.get_scene_radius(self.drawing.PICK_RADIUS)
+        if abs(end.x() - start.x()) > radius or abs(end.y() - start.y()) > radius:
+            _, line_ids = self.drawing.select_box(start, end)
+            if line_ids:
+                self.drawing.launch_delete_lines(line_ids)
+            return
+        picked = self.drawing.pick(end, types=('line',))
+        if picked is None:
+            return
+        self.drawing.launch_delete_line(picked[1])
 
     def handle_paint_event(self, event, painter):
         pass
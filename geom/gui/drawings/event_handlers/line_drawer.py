@@ -18,7 +18,7 @@ class LineDrawer(EventHandler):
             return
         if event.button() == Qt.LeftButton:
             if not self.started:
-                self.drawing.start = self.drawing.mapToScene(event.pos())
+                self.drawing.start = self.drawing.snap(self.drawing.mapToScene(event.pos()))
 
     def handle_mouse_released(self, event):
         if event.button() == Qt.LeftButton:
@@ -26,7 +26,7 @@ class LineDrawer(EventHandler):
                 self.started = True
             else:
                 self.started = False
-                self.drawing.end = self.drawing.mapToScene(event.pos())
+                self.drawing.end = self.drawing.snap(self.drawing.mapToScene(event.pos()))
                 self.drawing.launch_add_line(self.drawing.start, self.drawing.end)
                 self.drawing.start = None
                 self.drawing.end = None
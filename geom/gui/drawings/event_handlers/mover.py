@@ -1,11 +1,15 @@
-from PyQt5.QtGui import QTransform, QVector2D
-from PyQt5.QtWidgets import QGraphicsLineItem, QGraphicsEllipseItem
+import time
+
+from PyQt5.QtGui import QVector2D
 from PyQt5.QtCore import Qt
 
 import gui.drawings.graphics_view as gv
 
 from gui.drawings.event_handlers.drawing_event_handler import EventHandler
 
+# не чаще одного решения за столько секунд при перетаскивании
+DRAG_INTERVAL = 1 / 30
+
 
 class Mover(EventHandler):
     def __init__(self, drawing):
@@ -16,37 +20,61 @@ class Mover(EventHandler):
         self.end = None
         self.item_picked = None
         self.highlight = None
+        # позиция и время последнего отправленного кадра перетаскивания
+        self.last = None
+        # положение объекта в модели до перетаскивания (для линии - её первой точки)
+        self.origin = None
+        self.last_time = 0.
 
     def handle_mouse_moved(self, event):
-        pass
+        if self.item_picked is None:
+            return
+        now = time.monotonic()
+        if now - self.last_time < DRAG_INTERVAL:
+            return
+        pos = self.drawing.mapToScene(event.pos())
+        move_vector = QVector2D(pos - self.last)
+        if move_vector.isNull():
+            return
+        if self.highlight is not None:
+            # подсветка осталась бы на старом месте
+            self.drawing.scene().removeItem(self.highlight)
+            self.highlight = None
+        if self.item_picked == 'line':
+            self.drawing.launch_drag_line(self.item_to_move.id, move_vector)
+        elif self.item_picked == 'point':
+            self.drawing.launch_drag_point(self.item_to_move.id, move_vector)
+        self.last = pos
+        self.last_time = now
 
     def handle_mouse_pressed(self, event):
         if self.item_picked is None:
             pos = self.drawing.mapToScene(event.pos())
-            item = self.drawing.scene().itemAt(pos, QTransform())
-            if item is None or 'id' not in item.__dict__:
+            picked = self.drawing.pick(pos)
+            if picked is None:
                 return
-            if isinstance(item, QGraphicsLineItem):
-                self.item_to_move = item
-                self.start = pos
-                self.item_picked = 'line'
-                self.highlight = self.drawing.scene().addLine(item.line(), pen=gv.get_pen(Qt.green, 3))
-
-            if isinstance(item, QGraphicsEllipseItem):
-                self.item_to_move = item
-                self.start = pos
-                self.item_picked = 'point'
-                self.highlight = self.drawing.scene().addEllipse(item.rect(), pen=gv.get_pen(Qt.green, 4))
+            self.item_picked, _, self.item_to_move = picked
+            self.start = pos
+            if self.item_picked == 'line':
+                self.highlight = self.drawing.scene().addLine(self.item_to_move.line(), pen=gv.get_pen(Qt.green, 3))
+            else:
+                self.highlight = self.drawing.scene().addEllipse(self.item_to_move.rect(), pen=gv.get_pen(Qt.green, 4))
+            self.origin = self.drawing.get_origin(self.item_picked, self.item_to_move.id)
+            self.last = self.start
+            self.last_time = time.monotonic()
         else:
             self.end = self.drawing.mapToScene(event.pos())
+            # итоговое перемещение задано от положения до перетаскивания: кадры могли быть слиты, отброшены
+            # или прерваны, и куда дошёл объект, знает только логика
             move_vector = QVector2D(self.end - self.start)
             if self.item_picked == 'line':
-                self.drawing.launch_move_line(self.item_to_move.id, move_vector)
+                self.drawing.launch_move_line(self.item_to_move.id, move_vector, self.origin)
             elif self.item_picked == 'point':
-                self.drawing.launch_move_point(self.item_to_move.id, move_vector)
-            self.drawing.scene().removeItem(self.highlight)
-            for elem in (self.start, self.end, self.item_to_move):
-                elem = None
+                self.drawing.launch_move_point(self.item_to_move.id, move_vector, self.origin)
+            if self.highlight is not None:
+                self.drawing.scene().removeItem(self.highlight)
+                self.highlight = None
+            self.start, self.end, self.item_to_move, self.last, self.origin = None, None, None, None, None
             self.item_picked = None
 
     def handle_mouse_released(self, event):
@@ -5,6 +5,7 @@ from PyQt5.QtWidgets import QGraphicsView, QGraphicsScene
 import storage
 from gui.drawings.event_handlers import Mover, LineDrawer, Deleter, Chooser
 from gui.event_bus import Event
+from gui.utils import convert_array_to_point
 
 
 def get_pen(color, width):
@@ -13,8 +14,18 @@ def get_pen(color, width):
     return pen
 
 
+def get_changed_point_ids(task_result):
+    # None - перерисовать всю сцену
+    if task_result is None:
+        return None
+    return task_result.get('point_ids')
+
+
 class GraphicsView(QGraphicsView):
     POINT_RADIUS = 2
+    # радиусы захвата объекта и привязки к точке в пикселях экрана
+    PICK_RADIUS = 6
+    SNAP_RADIUS = 8
     tmpobj = []
 
     def __init__(self, event_bus):
@@ -32,22 +43,31 @@ class GraphicsView(QGraphicsView):
         self.task_result_handlers = {
             'add_line': self.on_line_add,
             'delete_line': self.on_line_delete,
+            'delete_lines': self.on_lines_delete,
             'move_line': self.on_line_moved,
             'move_point': self.on_point_moved,
             'add_constraint': self.on_constraint_applied,
+            'batch': self.on_batch,
             # 'clicked_constraint': self.on_constraint_clicked,
         }
 
         self.lines = {}
         self.points = {}
+        # point id -> ids of the lines drawn through it, to redraw only the lines of the moved points
+        self.point_lines = {}
         self.blocked = False
         self.line_id_counter = 0
         self.point_id_counter = 0
         self.storage = storage.Storage()
+        # положения точек и линий после последней задачи (TaskResult.index): хранилище меняет поток логики,
+        # координаты из него здесь не читаются
+        self.index = None
         self.event_bus = event_bus
 
         super(GraphicsView, self).__init__()
         self.setScene(QGraphicsScene())
+        # перетаскивание идёт между двумя щелчками, движения мыши нужны без нажатой кнопки
+        self.setMouseTracking(True)
         self.handler = LineDrawer(self)
 
     def set_handler(self, mode):
@@ -74,14 +94,22 @@ class GraphicsView(QGraphicsView):
     def mousePressEvent(self, event):
         self.handler.handle_mouse_pressed(event)
 
-    @process_if_enabled
     def mouseMoveEvent(self, event):
-        self.handler.handle_mouse_moved(event)
+        # движения мыши во время расчета просто пропускаем, без сообщения об ошибке
+        if not self.blocked:
+            self.handler.handle_mouse_moved(event)
 
     @process_if_enabled
     def mouseReleaseEvent(self, event):
         self.handler.handle_mouse_released(event)
 
+    def keyPressEvent(self, event):
+        # Esc во время расчета прерывает решение
+        if event.key() == Qt.Key_Escape and self.blocked:
+            self.event_bus.dispatch(Event(name='cancel_solve'))
+            return
+        super(GraphicsView, self).keyPressEvent(event)
+
     @block_processing
     def launch_add_line(self, point_1, point_2):
         self.event_bus.dispatch(Event(name='add_line', point_1=point_1, point_2=point_2))
@@ -91,12 +119,24 @@ class GraphicsView(QGraphicsView):
         self.event_bus.dispatch(Event(name='delete_line', line_id=line_id))
 
     @block_processing
-    def launch_move_line(self, line_id, move_vector):
-        self.event_bus.dispatch(Event(name='move_line', line_id=line_id, move_vector=move_vector))
+    def launch_delete_lines(self, line_ids):
+        self.event_bus.dispatch(Event(name='delete_lines', line_ids=line_ids))
+
+    # origin - положение точки (первой точки линии) до перемещения, move_vector тогда отсчитывается от него
+    @block_processing
+    def launch_move_line(self, line_id, move_vector, origin=None):
+        self.event_bus.dispatch(Event(name='move_line', line_id=line_id, move_vector=move_vector, origin=origin))
 
     @block_processing
-    def launch_move_point(self, point_id, move_vector):
-        self.event_bus.dispatch(Event(name='move_point', point_id=point_id, move_vector=move_vector))
+    def launch_move_point(self, point_id, move_vector, origin=None):
+        self.event_bus.dispatch(Event(name='move_point', point_id=point_id, move_vector=move_vector, origin=origin))
+
+    # кадры перетаскивания не блокируют сцену, лишние кадры сливаются в очереди логики
+    def launch_drag_line(self, line_id, move_vector):
+        self.event_bus.dispatch(Event(name='move_line', line_id=line_id, move_vector=move_vector, drag=True))
+
+    def launch_drag_point(self, point_id, move_vector):
+        self.event_bus.dispatch(Event(name='move_point', point_id=point_id, move_vector=move_vector, drag=True))
 
     def add_new_constraint_object(self, obj_id, obj_type, item):
         success = self.event_bus.dispatch(Event(name='new_constraint_obj', obj_id=obj_id, obj_type=obj_type))
@@ -112,6 +152,9 @@ class GraphicsView(QGraphicsView):
         self.tmpobj.append(tmp)
 
     def on_task_done(self, task_result):
+        # у задач пакета своего снимка нет, им нужен снимок после всего пакета
+        if task_result.index is not None:
+            self.index = task_result.index
         method = self.task_result_handlers.get(task_result.name)
         if method is None:
             return
@@ -124,8 +167,7 @@ class GraphicsView(QGraphicsView):
         line_id = task_result.get('line_id', None)
         if None in (p1_id, p2_id, line_id):
             raise RuntimeError('invalid_result')
-        point1 = self.storage.points[p1_id]
-        point2 = self.storage.points[p2_id]
+        point1, point2 = map(convert_array_to_point, self.index.get_coords([p1_id, p2_id]))
         line_to_add = QLineF(point1.x(), point1.y(), point2.x(), point2.y())
         line_to_add.id = line_id
         line_handle = self.scene().addLine(line_to_add, pen=get_pen(Qt.black, 3))
@@ -155,6 +197,8 @@ class GraphicsView(QGraphicsView):
 
         self.points[p1_id] = point1_handle
         self.points[p2_id] = point2_handle
+        self.point_lines.setdefault(p1_id, set()).add(line_id)
+        self.point_lines.setdefault(p2_id, set()).add(line_id)
 
     def on_line_delete(self, task_result):
         line_id = task_result.get('line_id', None)
@@ -171,20 +215,39 @@ class GraphicsView(QGraphicsView):
             raise RuntimeError('invalid ids in result')
         for item in (point1_handle, point2_handle, line_handle):
             self.scene().removeItem(item)
+        del self.lines[line_id]
+        for point_id in (p1_id, p2_id):
+            self.point_lines[point_id].discard(line_id)
+            if not self.point_lines[point_id]:
+                del self.point_lines[point_id]
+                del self.points[point_id]
+
+    def on_lines_delete(self, task_result):
+        for line_id in task_result.get('line_ids', []):
+            self.on_line_delete({'line_id': line_id})
 
     def on_line_moved(self, task_result):
-        self.redraw_scene()
+        self.redraw_scene(get_changed_point_ids(task_result))
 
     def on_point_moved(self, task_result):
-        self.redraw_scene()
+        self.redraw_scene(get_changed_point_ids(task_result))
 
     def clear_highlights(self):
         for elem in self.tmpobj:
             self.scene().removeItem(elem)
+        # пакет снимает подсветку после каждой задачи, удалённые элементы не удаляем повторно
+        self.tmpobj.clear()
 
     def on_constraint_applied(self, task_result):
         self.clear_highlights()
-        self.redraw_scene()
+        self.redraw_scene(get_changed_point_ids(task_result))
+
+    def on_batch(self, task_result):
+        # задачи пакета - как по отдельности, положения точек - после общего решения в конце
+        for result in task_result.get('results', []):
+            self.on_task_done(result)
+        self.clear_highlights()
+        self.redraw_scene(get_changed_point_ids(task_result))
 
     def on_constraint_clicked(self, event):
         self.clear_highlights()
@@ -200,25 +263,83 @@ class GraphicsView(QGraphicsView):
             self.tmpobj.append(tmp)
 
 
-    def redraw_scene(self):
-        for key, value in self.storage.lines.items():
-            line_dict = self.lines.get(key)  # line should definitely exist
-            line_handle = line_dict['line']
-            p1_id = value['p1_id']
-            p2_id = value['p2_id']
+    def redraw_scene(self, point_ids=None):
+        """
+        point_ids: points moved by the last task, only they and their lines are updated;
+        the whole scene by default
+        """
+        if point_ids is not None:
+            return self.redraw_points(point_ids)
+        line_ids, point_ids, segments = self.index.line_ids, self.index.line_point_ids, self.index.segments
+        for line_id, (p1_id, p2_id), (coords1, coords2) in zip(line_ids.tolist(), point_ids.tolist(), segments):
+            line_handle = self.lines[line_id]['line']  # line should definitely exist
 
-            point1 = self.storage.points.get(p1_id)
-            point1_handle = self.points[p1_id]
-            point1_handle.setRect(point1.x() - self.POINT_RADIUS,
-                                  point1.y() - self.POINT_RADIUS,
-                                  self.POINT_RADIUS ** 2,
-                                  self.POINT_RADIUS ** 2)
+            point1 = convert_array_to_point(coords1)
+            self.set_point_rect(self.points[p1_id], point1)
 
-            point2 = self.storage.points.get(p2_id)
-            point2_handle = self.points[p2_id]
-            point2_handle.setRect(point2.x() - self.POINT_RADIUS,
-                                  point2.y() - self.POINT_RADIUS,
-                                  self.POINT_RADIUS ** 2,
-                                  self.POINT_RADIUS ** 2)
+            point2 = convert_array_to_point(coords2)
+            self.set_point_rect(self.points[p2_id], point2)
 
             line_handle.setLine(QLineF(point1.x(), point1.y(), point2.x(), point2.y()))
+
+    def redraw_points(self, point_ids):
+        point_ids = [point_id for point_id in point_ids if point_id in self.points]
+        line_ids = set()
+        for point_id, coords in zip(point_ids, self.index.get_coords(point_ids)):
+            self.set_point_rect(self.points[point_id], convert_array_to_point(coords))
+            line_ids.update(self.point_lines.get(point_id, ()))
+        for line_id in line_ids:
+            line_dict = self.lines[line_id]
+            coords1, coords2 = self.index.get_coords([line_dict['p1_id'], line_dict['p2_id']])
+            line_dict['line'].setLine(QLineF(coords1[0], coords1[1], coords2[0], coords2[1]))
+
+    def get_scene_radius(self, radius):
+        # пиксели экрана в единицы сцены
+        return radius / self.transform().m11()
+
+    def pick(self, pos, types=('point', 'line')):
+        """
+        The point or the line nearest to the scene position pos: (type, id, item) or None.
+        Points are picked before lines, they are drawn on top.
+        """
+        index = self.index
+        if index is None:
+            return None
+        radius = self.get_scene_radius(self.PICK_RADIUS)
+        if 'point' in types:
+            point_id = index.nearest_point(pos.x(), pos.y(), radius)
+            if point_id in self.points:
+                return 'point', point_id, self.points[point_id]
+        if 'line' in types:
+            line_id = index.nearest_segment(pos.x(), pos.y(), radius)
+            if line_id in self.lines:
+                return 'line', line_id, self.lines[line_id]['line']
+        return None
+
+    def get_origin(self, item_type, item_id):
+        # положение точки или первой точки линии в модели
+        point_id = item_id if item_type == 'point' else self.lines[item_id]['p1_id']
+        return convert_array_to_point(self.index.get_coords([point_id])[0])
+
+    def snap(self, pos):
+        # ближайшая точка эскиза в радиусе привязки или сама позиция
+        if self.index is None:
+            return pos
+        point_id = self.index.nearest_point(pos.x(), pos.y(), self.get_scene_radius(self.SNAP_RADIUS))
+        if point_id is None:
+            return pos
+        return convert_array_to_point(self.index.get_coords([point_id])[0])
+
+    def select_box(self, start, end):
+        """
+        Ids of the points and of the lines inside the rectangle with the corners start and end.
+        """
+        if self.index is None:
+            return [], []
+        return self.index.box(start.x(), start.y(), end.x(), end.y())
+
+    def set_point_rect(self, point_handle, point):
+        point_handle.setRect(point.x() - self.POINT_RADIUS,
+                             point.y() - self.POINT_RADIUS,
+                             self.POINT_RADIUS ** 2,
+                             self.POINT_RADIUS ** 2)
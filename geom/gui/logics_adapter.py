@@ -8,8 +8,8 @@ class LogicsAdapter(QObject):
     def __init__(self, event_bus):
         QObject.__init__(self)
         self.handled_events = {
-            'add_line', 'add_constraint', 'delete_line', 'delete_constraint', 'move_line',
-            'move_point'
+            'add_line', 'add_constraint', 'delete_line', 'delete_lines', 'delete_constraint', 'move_line',
+            'move_point', 'cancel_solve', 'batch'
         }
         methods_arr = [self.add_task] * len(self.handled_events)
         self.methods_mapping = dict(zip(self.handled_events, methods_arr))
@@ -20,6 +20,7 @@ class LogicsAdapter(QObject):
         self.logics_thread = QThread()
         self.logics_object.moveToThread(self.logics_thread)
         self.logics_object.task_done.connect(self.deal_task_result)
+        self.logics_object.dof_changed.connect(self.deal_dof)
         # noinspection PyUnresolvedReferences
         self.logics_thread.started.connect(self.logics_object.run)
         self.logics_thread.start()
@@ -39,6 +40,11 @@ class LogicsAdapter(QObject):
 
     def deal_task_result(self, result):
         if result.error is not None:
+            # после ошибки (в том числе прерванного решения) сцена снова доступна
+            self.event_bus.dispatch(Event('block', is_set=False))
             return self.event_bus.dispatch(Event(name='error', text=result.error))
 
         self.event_bus.dispatch(Event(name='task_done', result=result))
+
+    def deal_dof(self, dof):
+        self.event_bus.dispatch(Event(name='dof_changed', dof=dof))
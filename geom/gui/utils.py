@@ -1,6 +1,6 @@
-from PyQt5.QtCore import QPoint
+from PyQt5.QtCore import QPointF
 
 
 def convert_array_to_point(arr_point):
-    point = QPoint(arr_point[0], arr_point[1])
+    point = QPointF(arr_point[0], arr_point[1])
     return point
@@ -0,0 +1,263 @@
+import numpy as np
+
+from constraint import CONSTRAINT_NAMES, LINEAR_CONSTRAINTS
+from logic.kernels import KINDS
+from logic.linalg import JacobianPattern
+from storage import LINE, POINT
+
+
+class ConstraintBatch:
+    """
+    All constraints of one kind with their global indexes in the Newton system:
+    lam_indexes (N, E) - lambdas, coord_indexes (N, 2 * points_num) - x, y of the points.
+    Coordinates with indexes from size on are constants (fixed points): they are read
+    from the coordinates vector, but are not unknowns of the system.
+    """
+
+    def __init__(self, kind, constraint_ids, values, lam_indexes, coord_indexes, size=None):
+        self.kind = kind
+        self.constraint_ids = constraint_ids
+        self.values = np.asarray(values, dtype=np.double)
+        self.lam_indexes = np.asarray(lam_indexes, dtype=np.int64).reshape((len(constraint_ids), kind.equations_num))
+        self.coord_indexes = np.asarray(coord_indexes, dtype=np.int64).reshape((len(constraint_ids), -1))
+        self.free = np.ones(self.coord_indexes.shape, dtype=bool)
+        self.pattern_mask = None
+        if size is not None and not (self.coord_indexes < size).all():
+            self.free = self.coord_indexes < size
+            rows, cols = self.get_all_pattern_indexes()
+            self.pattern_mask = (rows < size) & (cols < size)
+        self.delta_indexes = np.where(self.free, self.coord_indexes, 0)
+
+    def evaluate(self, x):
+        # x - текущие координаты (v + dv)
+        u = x[self.coord_indexes] @ self.kind.diff.T
+        g, gu, hu = self.kind.kernel(u, self.values)
+        grad = gu @ self.kind.diff
+        hess = None
+        if hu is not None:
+            hess = np.einsum('ui,neuw,wj->neij', self.kind.diff, hu, self.kind.diff)
+        return g, grad, hess
+
+    def get_all_pattern_indexes(self):
+        n, e = self.lam_indexes.shape
+        p = self.coord_indexes.shape[1]
+        lam = self.lam_indexes
+        coord = self.coord_indexes
+        rows = [
+            np.broadcast_to(lam[:, :, None], (n, e, p)),
+            np.broadcast_to(coord[:, :, None], (n, p, e)),
+            np.broadcast_to(coord[:, :, None], (n, p, p)),
+        ]
+        cols = [
+            np.broadcast_to(coord[:, None, :], (n, e, p)),
+            np.broadcast_to(lam[:, None, :], (n, p, e)),
+            np.broadcast_to(coord[:, None, :], (n, p, p)),
+        ]
+        return np.concatenate([r.ravel() for r in rows]), np.concatenate([c.ravel() for c in cols])
+
+    def get_pattern_indexes(self):
+        rows, cols = self.get_all_pattern_indexes()
+        if self.pattern_mask is None:
+            return rows, cols
+        return rows[self.pattern_mask], cols[self.pattern_mask]
+
+    def get_residual_pattern_indexes(self):
+        # J = grad(g): строки - уравнения (индексы лямбд), столбцы - координаты, постоянные не входят
+        n, e = self.lam_indexes.shape
+        p = self.coord_indexes.shape[1]
+        rows = np.broadcast_to(self.lam_indexes[:, :, None], (n, e, p))
+        cols = np.broadcast_to(self.coord_indexes[:, None, :], (n, e, p))
+        free = np.broadcast_to(self.free[:, None, :], (n, e, p))
+        return rows[free], cols[free]
+
+    def add_residual_jf(self, x, F, jacobian=True):
+        """
+        Adds g to F and returns the values of grad(g) in the order of get_residual_pattern_indexes
+        (None if jacobian is False), x - current coordinates.
+        """
+        g, grad, _ = self.evaluate(x)
+        F[self.lam_indexes] += g
+        if not jacobian:
+            return None
+        return grad[np.broadcast_to(self.free[:, None, :], grad.shape)]
+
+    def add_jf(self, x, delta_x, F, jacobian=True):
+        """
+        Adds the constraint terms of the batch to F and returns its Jacobian values in the pattern order
+        (None if jacobian is False), x - current coordinates (coords_vector + delta_x):
+        F = [g; lam * grad(g)], J = [[0, grad(g)], [grad(g)^T, lam * hess(g)]];
+        the displacement terms W dv and W of the objective are added once per unknown by get_jf_func
+        """
+        g, grad, hess = self.evaluate(x)
+        lam = delta_x[self.lam_indexes]
+
+        F[self.lam_indexes] += g
+        local_f = np.einsum('ne,nep->np', lam, grad)
+        F += np.bincount(self.delta_indexes[self.free], weights=local_f[self.free], minlength=len(F))
+        if not jacobian:
+            return None
+
+        n, p = self.coord_indexes.shape
+        hess_block = np.zeros((n, p, p))
+        if hess is not None:
+            hess_block = np.einsum('ne,nepq->npq', lam, hess)
+        values = np.concatenate([grad.ravel(), grad.transpose((0, 2, 1)).ravel(), hess_block.ravel()])
+        if self.pattern_mask is None:
+            return values
+        return values[self.pattern_mask]
+
+
+def get_point_rows(storage, constraint_rows):
+    """
+    Rows of the points of constraints with the same objects layout (N, points_num):
+    at first the ends of line objects, then point objects.
+    """
+    constraints = storage.constraints
+    constraint_rows = np.asarray(constraint_rows, dtype=np.int64)
+    columns = []
+    for i, object_type in enumerate(constraints.object_types[constraint_rows[0]].tolist()):
+        objects = constraints.objects[constraint_rows, i]
+        if object_type == LINE:
+            columns.append(storage.lines.points[objects])
+        elif object_type == POINT:
+            columns.append(objects[:, None])
+    return np.hstack(columns)
+
+
+def get_point_indexes(storage, constraint_id):
+    point_rows = get_point_rows(storage, [storage.constraints.get_row(constraint_id)])[0]
+    return storage.points.row_ids[point_rows].tolist()
+
+
+def get_coord_classes(storage, point_rows):
+    """
+    Class of every coordinate (len(point_rows), 2) of the points: coordinates tied by the linear
+    constraints (storage.constraints.linked) are one class. Classes are numbered in the order
+    of the first appearance of their coordinates x1, y1, x2, y2, ...
+    Also returns the ids of the points and the fixed flag of every class.
+    """
+    linked = storage.constraints.linked
+    point_ids = storage.points.row_ids[point_rows].tolist()
+    numbers = {}
+    coord_classes = np.array([numbers.setdefault(linked.find((point_id, axis)), len(numbers))
+                              for point_id in point_ids for axis in range(2)], dtype=np.int64).reshape((-1, 2))
+    fixed = np.zeros(len(numbers), dtype=bool)
+    fixed[coord_classes[[i for i, point_id in enumerate(point_ids) if point_id in linked.fixed]].ravel()] = True
+    return coord_classes, fixed
+
+
+def group_constraints(storage, constraint_ids):
+    """
+    Batches of the constraints, number of lambdas, rows of the points of the constraints,
+    variable of every coordinate of the points (len(point_rows), 2), number of the unknowns
+    among the variables, the fixed flag of every variable and the weight of every point -
+    the number of the constraints on it, linear ones too.
+
+    Linear constraints (constraint.LINEAR_CONSTRAINTS) give no equations: the coordinates they tie
+    are one variable, the coordinates of fixed points are constants. The unknowns of the Newton system
+    are the variables 0 .. var_num - 1: not fixed and used by the batches. The other variables -
+    constants and the coordinates used only by linear constraints - are after them.
+    Lambdas are numbered in the order of constraint_ids, points and unknowns in the order
+    of their first appearance in the batches.
+    """
+    constraints = storage.constraints
+    all_rows = constraints.get_rows(constraint_ids)
+    linear_codes = [CONSTRAINT_NAMES.index(name) for name in LINEAR_CONSTRAINTS]
+    is_linear = np.isin(constraints.kind[all_rows], linear_codes)
+    rows = all_rows[~is_linear]
+    kinds = constraints.kind[rows]
+    # по коду ограничения
+    equations_num = np.array([KINDS[name].equations_num for name in CONSTRAINT_NAMES], dtype=np.int64)
+    points_num = np.array([KINDS[name].points_num for name in CONSTRAINT_NAMES], dtype=np.int64)
+    lam_starts = np.cumsum(equations_num[kinds]) - equations_num[kinds]
+    lam_num = int(equations_num[kinds].sum())
+
+    codes, first = np.unique(kinds, return_index=True)
+    codes = codes[np.argsort(first)]
+    groups = [(code, np.flatnonzero(kinds == code)) for code in codes]
+    group_points = [get_point_rows(storage, rows[selected]) for code, selected in groups]
+
+    # points of all constraints one after another, in the order of constraint_ids
+    point_starts = np.cumsum(points_num[kinds]) - points_num[kinds]
+    all_points = np.zeros(int(points_num[kinds].sum()), dtype=np.int64)
+    for (code, selected), point_rows in zip(groups, group_points):
+        all_points[point_starts[selected][:, None] + np.arange(point_rows.shape[1])] = point_rows
+    batch_points_num = len(np.unique(all_points))
+    linear_rows = all_rows[is_linear]
+    for code in np.unique(constraints.kind[linear_rows]):
+        selected = linear_rows[constraints.kind[linear_rows] == code]
+        all_points = np.concatenate([all_points, get_point_rows(storage, selected).ravel()])
+    unique_rows, first, counts = np.unique(all_points, return_index=True, return_counts=True)
+    point_rows = unique_rows[np.argsort(first)]
+    point_weights = counts[np.argsort(first)].astype(np.double)
+
+    # точки уравнений идут первыми, поэтому их классы - первые; неизвестные из них - незакреплённые
+    coord_classes, fixed = get_coord_classes(storage, point_rows)
+    batch_classes_num = int(coord_classes[:batch_points_num].max()) + 1 if batch_points_num else 0
+    is_unknown = ~fixed & (np.arange(len(fixed)) < batch_classes_num)
+    order = np.concatenate([np.flatnonzero(is_unknown), np.flatnonzero(~is_unknown)])
+    class_vars = np.empty(len(fixed), dtype=np.int64)
+    class_vars[order] = np.arange(len(fixed))
+    coord_vars = class_vars[coord_classes]
+    var_num = int(is_unknown.sum())
+    size = lam_num + var_num
+    row_to_matrix = np.full((storage.points.size, 2), -1, dtype=np.int64)
+    row_to_matrix[point_rows] = coord_vars
+
+    batches = []
+    for (code, selected), group_rows in zip(groups, group_points):
+        kind = KINDS[CONSTRAINT_NAMES[code]]
+        lam_indexes = lam_starts[selected][:, None] + np.arange(kind.equations_num)
+        coord_indexes = lam_num + row_to_matrix[group_rows]  # x, y
+        batches.append(ConstraintBatch(kind, constraints.row_ids[rows[selected]].tolist(),
+                                       np.nan_to_num(constraints.value[rows[selected]]),
+                                       lam_indexes, coord_indexes, size))
+    return batches, lam_num, point_rows, coord_vars, var_num, fixed[order], point_weights
+
+
+def get_jacobian_pattern(batches, lam_num, size, backend):
+    # диагональ блока координат - веса перемещений, она есть и у неизвестных без нелинейных ограничений
+    diagonal = np.arange(lam_num, size, dtype=np.int64)
+    indexes = [batch.get_pattern_indexes() for batch in batches] + [(diagonal, diagonal)]
+    rows = np.concatenate([r for r, c in indexes])
+    cols = np.concatenate([c for r, c in indexes])
+    return JacobianPattern(rows, cols, size, backend)
+
+
+def get_residual_pattern(batches, lam_num, var_num, backend):
+    indexes = [batch.get_residual_pattern_indexes() for batch in batches]
+    rows = np.concatenate([r for r, c in indexes]) if indexes else np.zeros(0, dtype=np.int64)
+    cols = np.concatenate([c for r, c in indexes]) - lam_num if indexes else np.zeros(0, dtype=np.int64)
+    return JacobianPattern(rows, cols, lam_num, backend, cols_num=var_num)
+
+
+def get_residual_jf_func(batches, coords_vector, pattern, coord_delta, jacobian=True):
+    # постановка без лямбд: неизвестные - смещения координат, F = g, J = grad(g) (lam_num x var_num)
+    x = np.array(coords_vector, dtype=np.double)
+    # coords_vector - [лямбды, переменные], лямбд столько же, сколько строк J
+    x[pattern.size:pattern.size + len(coord_delta)] += coord_delta
+    F = np.zeros(pattern.size)
+    J_values = [batch.add_residual_jf(x, F, jacobian) for batch in batches]
+    if not jacobian:
+        return None, F
+    if not J_values:
+        return pattern.assemble(np.zeros(0)), F
+    return pattern.assemble(np.concatenate(J_values)), F
+
+
+def get_jf_func(batches, coords_vector, pattern, start_delta_x, var_weights, jacobian=True):
+    """
+    J, F of the Lagrange system of min 1/2 sum(var_weights * dv^2) subject to g = 0:
+    F = [g; W dv + sum(lam * grad(g))], J = [[0, grad(g)], [grad(g)^T, W + sum(lam * hess(g))]]
+    """
+    delta_x = np.asarray(start_delta_x, dtype=np.double)
+    lam_num = len(delta_x) - len(var_weights)
+    # после неизвестных в coords_vector идут постоянные координаты
+    x = np.array(coords_vector, dtype=np.double)
+    x[:len(delta_x)] += delta_x
+    F = np.zeros(len(delta_x))
+    F[lam_num:] = var_weights * delta_x[lam_num:]
+    J_values = [batch.add_jf(x, delta_x, F, jacobian) for batch in batches]
+    if not jacobian:
+        return None, F
+    return pattern.assemble(np.concatenate(J_values + [var_weights])), F
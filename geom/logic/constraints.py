@@ -1,444 +1,174 @@
-
+import time
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 
 import numpy as np
-import math
-
-from logic.newton import newtons_method
-
-DEP_DICT = {
-    'points_coincidence_constraint': 6,
-    'points_dist_constraint': 5,
-    'parallel_constraint': 9,
-    'perpendicular_constraint': 9,
-    'angle_constraint': 9,
-    'horizontal_constraint': 5,
-    'vertical_constraint': 5,
-    'point_belongs_line_constraint': 7
-}
-
-# индексы для всех ограничений, кроме совпадения точек
-L = 0  # L (lambda)
-X_1 = 1
-Y_1 = 2
-X_2 = 3
-Y_2 = 4
-X_3 = 5
-Y_3 = 6
-X_4 = 7
-Y_4 = 8
-# для ограничения совпадения двух точек нужны две лямбда, поэтому другие индексы:
-# COIN - сокращенно от Coincidence (совпадение)
-COIN_L_1 = 0  # L_1 (lambda1)
-COIN_L_2 = 1  # L_2 (lambda2)
-COIN_X_1 = 2
-COIN_Y_1 = 3
-COIN_X_2 = 4
-COIN_Y_2 = 5
-
-
-def get_points_coincidence_constraint(v, dv):
-    F = np.array([
-        v[COIN_X_2] + dv[COIN_X_2] - v[COIN_X_1] - dv[COIN_X_1],
-        v[COIN_Y_2] + dv[COIN_Y_2] - v[COIN_Y_1] - dv[COIN_Y_1],
-        dv[COIN_X_1] - dv[COIN_L_1],
-        dv[COIN_Y_1] - dv[COIN_L_2],
-        dv[COIN_X_2] + dv[COIN_L_1],
-        dv[COIN_Y_2] + dv[COIN_L_2],
-    ])
-    J = np.array([
-        [0, 0, -1, 0, 1, 0],
-        [0, 0, 0, -1, 0, 1],
-        [-1, 0, 1, 0, 0, 0],
-        [0, -1, 0, 1, 0, 0],
-        [1, 0, 0, 0, 1, 0],
-        [0, 1, 0, 0, 0, 1]
-    ], dtype=np.double)
-    return J, F
-
-
-def get_points_dist_constraint(v, d, dv):
-    F = np.array([
-        (v[X_2] + dv[X_2] - v[X_1] - dv[X_1]) ** 2 + (v[Y_2] + dv[Y_2] - v[Y_1] - dv[Y_1]) ** 2 - d ** 2,
-        dv[X_1] - 2 * dv[L] * (v[X_2] + dv[X_2] - v[X_1] - dv[X_1]),
-        dv[Y_1] - 2 * dv[L] * (v[Y_2] + dv[Y_2] - v[Y_1] - dv[Y_1]),
-        dv[X_2] + 2 * dv[L] * (v[X_2] + dv[X_2] - v[X_1] - dv[X_1]),
-        dv[Y_2] + 2 * dv[L] * (v[Y_2] + dv[Y_2] - v[Y_1] - dv[Y_1])
-    ])
-    ax = v[X_2] + dv[X_2] - v[X_1] - dv[X_1]
-    ay = v[Y_2] + dv[Y_2] - v[Y_1] - dv[Y_1]
-    J = np.array([
-        [0, -2 * ax, -2 * ay, 2 * ax, 2 * ay],
-        [-2 * ax, 1 + 2 * dv[L], 0, -2 * dv[L], 0],
-        [-2 * ay, 0, 1 + 2 * dv[L], 0, -2 * dv[L]],
-        [2 * ax, -2 * dv[L], 0, 1 + 2 * dv[L], 0],
-        [2 * ay, 0, -2 * dv[L], 0, 1 + 2 * dv[L]]
-    ], dtype=np.double)
-    return J, F
-
-
-def get_angle_constraint(v, angle, dv):
-    # 0 < angle < pi / 2
-    # angle += 0.01
-    #инициализация тригонометрии
-    MIN_VALUE = 1e-5
-    cos2 = np.cos(angle * np.pi / 180) ** 2
-    if cos2 < MIN_VALUE:
-        cos2 = MIN_VALUE
-    sin2 = np.sin(angle * np.pi / 180) ** 2
-    if sin2 < MIN_VALUE:
-        sin2 = MIN_VALUE
-
-    #инициализация начальных векторов
-
-    x12 = v[X_2] + dv[X_2] - v[X_1] - dv[X_1]
-    y12 = v[Y_2] + dv[Y_2] - v[Y_1] - dv[Y_1]
-    x34 = v[X_4] + dv[X_4] - v[X_3] - dv[X_3]
-    y34 = v[Y_4] + dv[Y_4] - v[Y_3] - dv[Y_3]
-
-    # вектор промежуточных вычислений для уравнений и Якобиана.
-    a = np.array([
-        sin2 * (x12 ** 2 * x34 ** 2 + y12 ** 2 * y34 ** 2) + 2 * x12 * x34 * y12 * y34 - cos2 * (
-                x12 ** 2 * y34 ** 2 + y12 ** 2 * x34 ** 2),
-        -2 * sin2 * x34 ** 2 * x12 - 2 * x34 * y12 * y34 + 2 * cos2 * y34 ** 2 * x12,
-        -2 * sin2 * y34 ** 2 * y12 - 2 * x12 * x34 * y34 + 2 * cos2 * x34 ** 2 * y12,
-        2 * sin2 * x34 ** 2 * x12 + 2 * x34 * y12 * y34 - 2 * cos2 * y34 ** 2 * x12,
-        2 * sin2 * y34 ** 2 * y12 + 2 * x12 * x34 * y34 - 2 * cos2 * x34 ** 2 * y12,
-        -2 * sin2 * x12 ** 2 * x34 - 2 * x12 * y12 * y34 + 2 * cos2 * y12 ** 2 * x34,
-        -2 * sin2 * y12 ** 2 * y34 - 2 * x12 * x34 * y12 + 2 * cos2 * x12 ** 2 * y34,
-        2 * sin2 * x12 ** 2 * x34 + 2 * x12 * y12 * y34 - 2 * cos2 * y12 ** 2 * x34,
-        2 * sin2 * y12 ** 2 * y34 + 2 * x12 * x34 * y12 - 2 * cos2 * x12 ** 2 * y34
-    ], dtype=np.double)
-
-    # Вектор F описывает отклонение текущего состояния системы от удовлетворяющего ограничения.
-    F = np.array([
-        a[0],
-        dv[X_1] + dv[L] * a[1],
-        dv[Y_1] + dv[L] * a[2],
-        dv[X_2] + dv[L] * a[3],
-        dv[Y_2] + dv[L] * a[4],
-        dv[X_3] + dv[L] * a[5],
-        dv[Y_3] + dv[L] * a[6],
-        dv[X_4] + dv[L] * a[7],
-        dv[Y_4] + dv[L] * a[8]
-    ])
-    # матрица якоби
-    J = np.array([
-        [0, a[1], a[2], a[3], a[4], a[5], a[6], a[7], a[8]],
-        [a[1], 1 + 2 * dv[L] * (sin2 * x34 ** 2 - cos2 * y34 ** 2), 2 * dv[L] * x34 * y34,
-         -2 * dv[L] * (sin2 * x34 ** 2 - cos2 * y34 ** 2), -2 * dv[L] * x34 * y34,
-         2 * dv[L] * (2 * sin2 * x12 * x34 + y12 * y34), 2 * dv[L] * (y12 * x34 - 2 * cos2 * x12 * y34),
-         -2 * dv[L] * (2 * sin2 * x12 * x34 + y12 * y34), -2 * dv[L] * (y12 * x34 - 2 * cos2 * x12 * y34)],
-        [a[2], 2 * dv[L] * x34 * y34, 1 + 2 * dv[L] * (sin2 * y34 ** 2 - cos2 * x34 ** 2), -2 * dv[L] * x34 * y34,
-         -2 * dv[L] * (sin2 * y34 ** 2 - cos2 * x34 ** 2), 2 * dv[L] * (x12 * y34 - 2 * cos2 * y12 * x34),
-         2 * dv[L] * (2 * sin2 * y12 * y34 + x12 * x34), -2 * dv[L] * (x12 * y34 - 2 * cos2 * y12 * x34),
-         -2 * dv[L] * (2 * sin2 * y12 * y34 + x12 * x34)],
-        [a[3], 2 * dv[L] * (cos2 * y34 ** 2 - sin2 * x34 ** 2), -2 * dv[L] * x34 * y34,
-         1 + 2 * dv[L] * (sin2 * x34 ** 2 - cos2 * y34 ** 2), 2 * dv[L] * x34 * y34,
-         -2 * dv[L] * (2 * sin2 * x12 * x34 + y12 * y34), -2 * dv[L] * (x34 * y12 - 2 * cos2 * x12 * y34),
-         2 * dv[L] * (2 * sin2 * x12 * x34 + y12 * y34), 2 * dv[L] * (x34 * y12 - 2 * cos2 * x12 * y34)],
-        [a[4], -2 * dv[L] * x34 * y34, -2 * dv[L] * (sin2 * y34 ** 2 - cos2 * x34 ** 2), 2 * dv[L] * x34 * y34,
-         1 + 2 * dv[L] * (sin2 * y34 ** 2 - cos2 * x34 ** 2), -2 * dv[L] * (x12 * y34 - 2 * cos2 * y12 * x34),
-         -2 * dv[L] * (2 * sin2 * y12 * y34 + x12 * x34), 2 * dv[L] * (x12 * y34 - 2 * cos2 * y12 * x34),
-         2 * dv[L] * (2 * sin2 * y12 * y34 + x12 * x34)],
-        [a[5], 2 * dv[L] * (2 * sin2 * x12 * x34 + y12 * y34), 2 * dv[L] * (x12 * y34 - 2 * cos2 * y12 * x34),
-         -2 * dv[L] * (2 * sin2 * x12 * x34 + y12 * y34), -2 * dv[L] * (x12 * y34 - 2 * cos2 * y12 * x34),
-         1 + 2 * dv[L] * (sin2 * x12 ** 2 - cos2 * y12 ** 2), 2 * dv[L] * x12 * y12,
-         -2 * dv[L] * (sin2 * x12 ** 2 - cos2 * y12 ** 2), -2 * dv[L] * x12 * y12],
-        [a[6], 2 * dv[L] * (y12 * x34 - 2 * cos2 * x12 * y34), 2 * dv[L] * (2 * sin2 * y12 * y34 + x12 * x34),
-         -2 * dv[L] * (x34 * y12 - 2 * cos2 * x12 * y34), -2 * dv[L] * (2 * sin2 * y12 * y34 + x12 * x34),
-         2 * dv[L] * x12 * y12, 1 + 2 * dv[L] * (sin2 * y12 ** 2 - cos2 * x12 ** 2), -2 * dv[L] * x12 * y12,
-         -2 * dv[L] * (sin2 * y12 ** 2 - cos2 * x12 ** 2)],
-        [a[7], -2 * dv[L] * (2 * sin2 * x12 * x34 + y12 * y34), -2 * dv[L] * (x12 * y34 - 2 * cos2 * y12 * x34),
-         2 * dv[L] * (2 * sin2 * x12 * x34 + y12 * y34), 2 * dv[L] * (x12 * y34 - 2 * cos2 * y12 * x34),
-         -2 * dv[L] * (sin2 * x12 ** 2 - cos2 * y12 ** 2), -2 * dv[L] * x12 * y12,
-         1 + 2 * dv[L] * (sin2 * x12 ** 2 - cos2 * y12 ** 2), 2 * dv[L] * x12 * y12],
-        [a[8], -2 * dv[L] * (y12 * x34 - 2 * cos2 * x12 * y34), -2 * dv[L] * (2 * sin2 * y12 * y34 + x12 * x34),
-         2 * dv[L] * (x34 * y12 - 2 * cos2 * x12 * y34), 2 * dv[L] * (2 * sin2 * y12 * y34 + x12 * x34),
-         -2 * dv[L] * x12 * y12, -2 * dv[L] * (sin2 * y12 ** 2 - cos2 * x12 ** 2), 2 * dv[L] * x12 * y12,
-         1 + 2 * dv[L] * (sin2 * y12 ** 2 - cos2 * x12 ** 2)]
-    ], dtype=np.double)
-    return J, F
-
-
-def get_horizontal_constraint(v, dv):
-    F = np.array([
-        v[Y_2] + dv[Y_2] - v[Y_1] - dv[Y_1],
-        dv[X_1],
-        dv[Y_1] - dv[L],
-        dv[X_2],
-        dv[Y_2] + dv[L],
-    ])
-    J = np.array([
-        [0, 0, -1, 0, 1],
-        [0, 1, 0, 0, 0],
-        [-1, 0, 1, 0, 0],
-        [0, 0, 0, 1, 0],
-        [1, 0, 0, 0, 1]
-    ], dtype=np.double)
-    return J, F
-
-
-def get_vertical_constraint(v, dv):
-    F = np.array([
-        v[X_2] + dv[X_2] - v[X_1] - dv[X_1],
-        dv[X_1] - dv[L],
-        dv[Y_1],
-        dv[X_2] + dv[L],
-        dv[Y_2],
-    ])
-    J = np.array([
-        [0, -1, 0, 1, 0],
-        [-1, 1, 0, 0, 0],
-        [0, 0, 1, 0, 0],
-        [1, 0, 0, 1, 0],
-        [0, 0, 0, 0, 1]
-    ], dtype=np.double)
-    return J, F
-
-
-def get_parallel_constraint(v, dv):
-    ay12 = (v[Y_2] + dv[Y_2] - v[Y_1] - dv[Y_1])
-    ay34 = (v[Y_4] + dv[Y_4] - v[Y_3] - dv[Y_3])
-    ax12 = (v[X_2] + dv[X_2] - v[X_1] - dv[X_1])
-    ax34 = (v[X_4] + dv[X_4] - v[X_3] - dv[X_3])
-
-    F = np.array([
-        ax12 * ay34 - ax34 * ay12,
-
-        dv[X_1] - dv[L] * ay34,
-        dv[Y_1] + dv[L] * ax34,
-        dv[X_2] + dv[L] * ay34,
-        dv[Y_2] - dv[L] * ax34,
-
-        dv[X_3] + dv[L] * ay12,
-        dv[Y_3] - dv[L] * ax12,
-        dv[X_4] - dv[L] * ay12,
-        dv[Y_4] + dv[L] * ax12,
-    ])
-
-    J = np.array([
-        [0, -ay34, ax34, ay34, -ax34, ay12, ax12, -ay12, ax12],
-        [-ay34, 1, 0, 0, 0, 0, dv[L], 0, -dv[L]],
-        [ax34, 0, 1, 0, 0, -dv[L], 0, dv[L], 0],
-        [ay34, 0, 0, 1, 0, 0, -dv[L], 0, dv[L]],
-        [-ax34, 0, 0, 0, 1, dv[L], 0, -dv[L], 0],
-        [ay12, 0, -dv[L], 0, dv[L], 1, 0, 0, 0],
-        [-ax12, dv[L], 0, -dv[L], 0, 0, 1, 0, 0],
-        [-ay12, 0, dv[L], 0, -dv[L], 0, 0, 1, 0],
-        [ax12, -dv[L], 0, dv[L], 0, 0, 0, 0, 1],
-    ])
-    return J, F
-
-
-def get_perpendicular_constraint(v, dv):
-    ay12 = (v[Y_2] + dv[Y_2] - v[Y_1] - dv[Y_1])
-    ay34 = (v[Y_4] + dv[Y_4] - v[Y_3] - dv[Y_3])
-    ax12 = (v[X_2] + dv[X_2] - v[X_1] - dv[X_1])
-    ax34 = (v[X_4] + dv[X_4] - v[X_3] - dv[X_3])
-
-    F = np.array([
-        ax12 * ax34 + ay34 * ay12,
-
-        dv[X_1] - dv[L] * ax34,
-        dv[Y_1] - dv[L] * ay34,
-        dv[X_2] + dv[L] * ax34,
-        dv[Y_2] + dv[L] * ay34,
-
-        dv[X_3] - dv[L] * ax12,
-        dv[Y_3] - dv[L] * ay12,
-        dv[X_4] + dv[L] * ax12,
-        dv[Y_4] + dv[L] * ay12,
-    ])
-
-    J = np.array([
-        [0, -ax34, -ay34, ax34, ay34, -ax12, -ay12, ax12, ay12],
-        [-ax34, 1, 0, 0, 0, dv[L], 0, -dv[L], 0],
-        [-ay34, 0, 1, 0, 0, 0, dv[L], 0, -dv[L]],
-        [ax34, 0, 0, 1, 0, -dv[L], 0, dv[L], 0],
-        [ay34, 0, 0, 0, 1, 0, -dv[L], 0, dv[L]],
-        [-ax12, dv[L], 0, -dv[L], 0, 1, 0, 0, 0],
-        [-ay12, 0, dv[L], 0, -dv[L], 0, 1, 0, 0],
-        [ax12, -dv[L], 0, dv[L], 0, 0, 0, 1, 0],
-        [ay12, 0, -dv[L], 0, dv[L], 0, 0, 0, 1],
-    ])
-    return J, F
-
-
-def get_point_belongs_line_constraint(v, dv):
-    ax31 = (v[X_3] + dv[X_3] - v[X_1] - dv[X_1])
-    ay31 = (v[Y_3] + dv[Y_3] - v[Y_1] - dv[Y_1])
-    ay23 = (v[Y_2] + dv[Y_2] - v[Y_3] - dv[Y_3])
-    ax23 = (v[X_2] + dv[X_2] - v[X_3] - dv[X_3])
 
-    ay21 = (v[Y_2] + dv[Y_2] - v[Y_1] - dv[Y_1])
-    ax21 = (v[X_2] + dv[X_2] - v[X_1] - dv[X_1])
-
-    F = np.array([
-        ax31 * ay23 - ax23 * ay31,
-        dv[X_1] + dv[L] * (-ay23),
-        dv[Y_1] + dv[L] * ax23,
-        dv[X_2] + dv[L] * (-ay31),
-        dv[Y_2] + dv[L] * ax31,
-        dv[X_3] + dv[L] * ay21,
-        dv[Y_3] + dv[L] * (-ax21),
-    ])
-
-    J = np.array([
-        [0, -ay23, ax23, -ay31, ax31, ay21, -ax21],
-        [-ay23, 1, 0, 0, -dv[L], 0, dv[L]],
-        [ax23, 0, 1, dv[L], 0, -dv[L], 0],
-        [-ay31, 0, dv[L], 1, 0, 0, -dv[L]],
-        [ax31, -dv[L], 0, 0, 1, dv[L], 0],
-        [ay21, 0, -dv[L], 0, dv[L], 1, 0],
-        [-ax21, dv[L], 0, -dv[L], 0, 0, 1],
-    ])
-    return J, F
-
-
-def get_lam_num(storage):
-    lam_num = 0
-    for constraint in storage.constraints.values():
-        if constraint.name != 'points_coincidence_constraint':
-            lam_num += 1
-        else:
-            lam_num += 2
-    return lam_num
-
-
-def get_coords(storage, storage_to_matrix, lam_num):
-    coords_vector = [1.] * lam_num
-
-    # get current points position
-    for point_id in storage_to_matrix.keys():
-        coords_vector.append(storage.points[point_id].x())
-        coords_vector.append(storage.points[point_id].y())
-    return coords_vector
-
-
-def get_point_indexes(storage, constraint_id):
-    constraints = storage.constraints
-    constraint_point_indexes = []
-    # at first line objects
-    for object in constraints[constraint_id].objects:
-        if object['type'] == 'line':
-            p1_id = storage.lines[object['obj']]['p1_id']
-            p2_id = storage.lines[object['obj']]['p2_id']
-            constraint_point_indexes.append(p1_id)
-            constraint_point_indexes.append(p2_id)
-    # then point objects
-    for object in constraints[constraint_id].objects:
-        if object['type'] == 'point':
-            p_id = object['obj']
-            constraint_point_indexes.append(p_id)
-    return constraint_point_indexes
-
-
-def get_indices_mappings(storage):
-    storage_to_matrix = {}
-    matrix_to_storage = {}
-    lam_num = 0
-    all_ids = []
-    for constraint_id in storage.constraints:
-        if storage.constraints[constraint_id].name != 'points_coincidence_constraint':
-            lam_num += 1
-        else:
-            lam_num += 2
-
-        all_ids.extend(get_point_indexes(storage, constraint_id))
-    all_ids = [*set(all_ids)]
-    for matr_id, storage_id in enumerate(all_ids):
-        if storage_id not in storage_to_matrix:
-            matrix_to_storage[matr_id] = storage_id
-            storage_to_matrix[storage_id] = matr_id
-    return storage_to_matrix, matrix_to_storage
-
-
-def get_jf_func(storage, coords_vector, storage_to_matrix, lam_num, start_delta_x):
-    J = np.zeros((len(coords_vector), len(coords_vector)))
-    F = np.zeros(len(coords_vector))
-
-    constraints = storage.constraints
-    lamdas_counter = 0
-
-    # for each constraint
-    for constraint_id in constraints:
-        # global indexes list
-        constraint_coord_indexes = []
-
-        # find global indexes of lam for this constraint
-        if constraints[constraint_id].name != 'points_coincidence_constraint':
-            constraint_coord_indexes.append(lamdas_counter)
-            lamdas_counter += 1
-        else:
-            constraint_coord_indexes.append(lamdas_counter)
-            constraint_coord_indexes.append(lamdas_counter + 1)
-            lamdas_counter += 2
-
-        # find global indexes of x, y for this constraint
-        constraint_point_indexes = get_point_indexes(storage, constraint_id)
-        for point_index in constraint_point_indexes:
-            constraint_coord_indexes.append(lam_num + storage_to_matrix[point_index] * 2)  # x
-            constraint_coord_indexes.append(lam_num + storage_to_matrix[point_index] * 2 + 1)  # y
-
-        # find coords for this constraint
-        # TODO: иногда при наложении ограничения здесь list index out of range
-        local_coords_vector = [coords_vector[index] for index in constraint_coord_indexes]
-        local_start_delta_x = [start_delta_x[index] for index in constraint_coord_indexes]
-
-        # find local J, F
-        local_J = []
-        local_F = []
-        # in angle and dist constraints we add as second argument (dist or angle) - constraints[constraint_id].value
-        if constraints[constraint_id].name == 'points_coincidence_constraint':
-            local_J, local_F = get_points_coincidence_constraint(local_coords_vector, local_start_delta_x)
-        if constraints[constraint_id].name == 'points_dist_constraint':
-            local_J, local_F = get_points_dist_constraint(local_coords_vector, constraints[constraint_id].value,
-                                                          local_start_delta_x)
-        if constraints[constraint_id].name == 'parallel_constraint':
-            local_J, local_F = get_parallel_constraint(local_coords_vector, local_start_delta_x)
-        if constraints[constraint_id].name == 'perpendicular_constraint':
-            local_J, local_F = get_perpendicular_constraint(local_coords_vector, local_start_delta_x)
-        if constraints[constraint_id].name == 'angle_constraint':
-            local_J, local_F = get_angle_constraint(local_coords_vector, constraints[constraint_id].value,
-                                                    local_start_delta_x)
-        if constraints[constraint_id].name == 'horizontal_constraint':
-            local_J, local_F = get_horizontal_constraint(local_coords_vector, local_start_delta_x)
-        if constraints[constraint_id].name == 'vertical_constraint':
-            local_J, local_F = get_vertical_constraint(local_coords_vector, local_start_delta_x)
-        if constraints[constraint_id].name == 'point_belongs_line_constraint':
-            local_J, local_F = get_point_belongs_line_constraint(local_coords_vector, local_start_delta_x)
-
-        # add local J, F to global J, F
-        # we know global indexes: constraint_coord_indexes
-        for i in range(len(local_F)):
-            F[constraint_coord_indexes[i]] += local_F[i]
-
-        for i in range(len(local_J)):
-            for j in range(len(local_J)):
-                J[constraint_coord_indexes[i]][constraint_coord_indexes[j]] += local_J[i][j]
-
-    return J, F
-
-
-def update_coords_in_storage(storage, coords_vector, lam_num, matrix_to_storage):
-    for matrix_id, storage_id in matrix_to_storage.items():
-        storage.points[storage_id].setX(coords_vector[lam_num + matrix_id * 2])
-        storage.points[storage_id].setY(coords_vector[lam_num + matrix_id * 2 + 1])
+from logic.graph import get_constraint_graph
+from logic.linalg import AUTO
+from logic.newton import DEFAULT_STRATEGY, ERROR_CANCELLED, RESIDUAL_STRATEGIES, SolveCancelled, newtons_method
+from logic.system import ERROR_INCONSISTENT, get_compiled_system
+from logic.telemetry import SOLVE_END, SOLVE_START, SYSTEM, Tagged, get_monitor
+from logic.warm_start import get_warm_start
+
+# компонента с системой не меньше этого размера решается в пуле потоков отдельной задачей, меньшие - подряд
+# одной общей задачей (LAPACK и splu отпускают GIL, для маленьких систем накладные расходы пула больше выигрыша)
+PARALLEL_THRESHOLD = 500
+# столько итераций даётся решению от прошлых лямбд, потом решаем от обычного начального приближения
+WARM_START_MAX_ITER = 10
+
+
+def solve_system(system, coords_vector, start_delta_x, strategy=DEFAULT_STRATEGY, reuse=None, monitor=None,
+                 cancel=None, deadline=None):
+    """
+    Returns delta_x = [lambdas, coordinates] of the system for both formulations: the strategies of
+    RESIDUAL_STRATEGIES solve only for the coordinates, the lambdas stay as in start_delta_x.
+    """
+    if strategy not in RESIDUAL_STRATEGIES:
+        get_jf = partial(system.get_jf, coords_vector)
+        return solve_with_warm_start(partial(newtons_method, get_jf, strategy=strategy, reuse=reuse,
+                                             monitor=monitor, cancel=cancel, deadline=deadline),
+                                     start_delta_x, system.get_start_delta_x())
+    get_jf = partial(system.get_residual_jf, coords_vector)
+    lambdas, start_coord_delta = np.split(start_delta_x, [system.lam_num])
+    try:
+        coord_delta = solve_with_warm_start(partial(newtons_method, get_jf, strategy=strategy, reuse=reuse,
+                                                    monitor=monitor, cancel=cancel, deadline=deadline),
+                                            start_coord_delta, np.zeros(system.var_num))
+    except SolveCancelled as e:
+        e.delta_x = np.concatenate([lambdas, e.delta_x])
+        raise
+    return np.concatenate([lambdas, coord_delta])
+
+
+def solve_with_warm_start(solve, start_delta_x, cold_start):
+    if np.array_equal(start_delta_x, cold_start):
+        return solve(cold_start)
+    try:
+        return solve(start_delta_x, max_iter=WARM_START_MAX_ITER)
+    except SolveCancelled:
+        raise
+    except (np.linalg.LinAlgError, RuntimeError):
+        # прошлое решение может быть далеко от нового (например, после решения с нуля)
+        return solve(cold_start)
 
 
-def recalculate_point_positions(storage):
-    lam_num = get_lam_num(storage)
-    storage_to_matrix, matrix_to_storage = get_indices_mappings(storage)
-    coords_vector = get_coords(storage, storage_to_matrix, lam_num)
-    start_delta_x = [0.] * len(coords_vector)
-    for i in range(lam_num):
-        start_delta_x[i] = 1.
-    get_jf = partial(get_jf_func, storage, coords_vector, storage_to_matrix, lam_num)
+def run_task(task):
+    # прерванное решение компоненты возвращает лучшую итерацию вместо исключения
     try:
-        deltas = newtons_method(get_jf, start_delta_x)
-    except np.linalg.LinAlgError as e:
-        raise RuntimeError('Ограничение не добавлено. Возможно, ограничения несовместимы!')
-    coords_vector += deltas
-    # update point coords in storage
-    update_coords_in_storage(storage, coords_vector, lam_num, matrix_to_storage)
+        return task(), None
+    except SolveCancelled as e:
+        return e.delta_x, e
+
+
+def run_tasks(tasks):
+    return [run_task(task) for task in tasks]
+
+
+def get_parallel_groups(systems):
+    # индексы систем для задач пула: каждая большая отдельно, все маленькие вместе
+    large = [[index] for index, system in enumerate(systems) if system.size >= PARALLEL_THRESHOLD]
+    small = [index for index, system in enumerate(systems) if system.size < PARALLEL_THRESHOLD]
+    return large + [small] if small else large
+
+
+def get_sorted_ids(id_arrays):
+    if not id_arrays:
+        return []
+    return np.unique(np.concatenate(id_arrays)).tolist()
+
+
+def report_systems(monitor, systems):
+    for component, system in enumerate(systems):
+        nnz = system.pattern.get_nnz()
+        monitor(SYSTEM, {'component': component, 'size': system.size, 'lam_num': system.lam_num, 'nnz': nnz,
+                         'density': nnz / max(system.size ** 2, 1), 'backend': system.pattern.backend})
+
+
+def recalculate_point_positions(storage, backend=AUTO, point_ids=None, workers=None, strategy=DEFAULT_STRATEGY,
+                                reuse=None, warm_start=True, extrapolate=False, monitor=None, cancel=None,
+                                deadline=None, partial_result=False):
+    """
+    backend: 'dense', 'sparse' or 'auto' - the sparse Jacobian is used for systems
+    of at least linalg.SPARSE_THRESHOLD unknowns
+    point_ids: points touched by the edit; only the connected components of the constraint
+    graph containing them are solved, the whole sketch by default
+    workers: size of the thread pool for independent components, 1 solves them one by one;
+    only the systems of at least PARALLEL_THRESHOLD unknowns get their own task of the pool
+    strategy: step strategy of newtons_method - 'newton', 'line_search', 'dogleg', 'lm' or 'least_norm'
+    (the formulation without lambdas, see newton.RESIDUAL_STRATEGIES)
+    reuse: jacobian.JacobianReuse policy to reuse the factorized Jacobian between iterations
+    warm_start: start from the lambdas of the previous solves instead of 1.
+    extrapolate: also start from the previous displacement of the points (interactive drag)
+    monitor: telemetry callable, telemetry.get_monitor() by default
+    cancel: threading.Event to interrupt the solve
+    deadline: time.perf_counter() value to stop the solve at
+    newton.SolveCancelled with the largest residual_norm of the components is raised when the solve is interrupted
+    partial_result: move the points of the interrupted components to their best iterates, otherwise no point is moved
+
+    Returns the sorted ids of the points moved by the solve (see system.CHANGE_TOL),
+    for an interrupted solve they are SolveCancelled.point_ids.
+    """
+    if monitor is None:
+        monitor = get_monitor()
+    if monitor is not None:
+        start = time.perf_counter()
+    components = get_constraint_graph(storage).get_components(point_ids)
+    # the compiled systems are rebuilt only after points, lines or constraints were added or removed
+    systems = [get_compiled_system(storage, backend, constraint_ids) for constraint_ids in components]
+    coords_vectors = [system.get_coords(storage) for system in systems]
+    cache = get_warm_start(storage)
+    if warm_start:
+        start_vectors = [cache.get_start_delta_x(system, extrapolate) for system in systems]
+    else:
+        start_vectors = [system.get_start_delta_x() for system in systems]
+    monitors = [None] * len(systems)
+    if monitor is not None:
+        monitor(SOLVE_START, {'components': len(systems),
+                              'point_ids': None if point_ids is None else list(point_ids)})
+        report_systems(monitor, systems)
+        monitors = [Tagged(monitor, component=component) for component in range(len(systems))]
+    tasks = [partial(solve_system, *args, strategy=strategy, reuse=reuse, monitor=component_monitor,
+                     cancel=cancel, deadline=deadline)
+             for *args, component_monitor in zip(systems, coords_vectors, start_vectors, monitors)]
+    try:
+        # больше одной группы - есть хотя бы одна большая система
+        groups = get_parallel_groups(systems) if workers != 1 else []
+        if len(groups) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                group_results = list(executor.map(run_tasks, [[tasks[index] for index in group] for group in groups]))
+            results = [None] * len(tasks)
+            for group, group_result in zip(groups, group_results):
+                for index, result in zip(group, group_result):
+                    results[index] = result
+        else:
+            results = run_tasks(tasks)
+    except (np.linalg.LinAlgError, RuntimeError) as e:
+        if monitor is not None:
+            monitor(SOLVE_END, {'seconds': time.perf_counter() - start, 'converged': False, 'error': str(e)})
+        if isinstance(e, np.linalg.LinAlgError):
+            raise RuntimeError(ERROR_INCONSISTENT)
+        raise
+    interrupted = [e for _, e in results if e is not None]
+    if interrupted:
+        error = SolveCancelled(ERROR_CANCELLED, residual_norm=max(e.residual_norm for e in interrupted))
+        if monitor is not None:
+            monitor(SOLVE_END, {'seconds': time.perf_counter() - start, 'converged': False, 'error': str(error),
+                                'residual_norm': error.residual_norm})
+        if partial_result:
+            changed = []
+            for system, coords_vector, (delta_x, e) in zip(systems, coords_vectors, results):
+                # лямбды прерванного решения не запоминаем, они могут быть далеки от решения
+                if e is None:
+                    cache.store(system, delta_x)
+                changed.append(system.update_coords_in_storage(storage, coords_vector, delta_x))
+            error.point_ids = get_sorted_ids(changed)
+        raise error
+    # update point coords in storage only when every component converged
+    changed = []
+    for system, coords_vector, (delta_x, _) in zip(systems, coords_vectors, results):
+        cache.store(system, delta_x)
+        changed.append(system.update_coords_in_storage(storage, coords_vector, delta_x))
+    if monitor is not None:
+        monitor(SOLVE_END, {'seconds': time.perf_counter() - start, 'converged': True, 'error': None})
+    return get_sorted_ids(changed)
@@ -0,0 +1,229 @@
+"""
+Degrees of freedom of a sketch: how many independent motions of the points the constraints leave.
+
+Every component of the constraint graph is analyzed on its compiled system (see system.CompiledSystem):
+- structural: maximum matching of the equations and the unknowns they depend on (the Jacobian pattern),
+  an unmatched equation is over-constraining by the structure alone;
+- numerical: rank of the Jacobian of the equations (QR with column pivoting of J^T, SVD without scipy),
+  the constraints of the dependent equations are redundant, the null space gives the free coordinates
+  of every point.
+Coordinates tied by the linear constraints are one variable, fixed ones have no freedom.
+The result of a component is cached by its constraints and their values: the rank is the same for all
+but degenerate positions of the points, so moving points does not make a component dirty, and after
+adding or removing constraints only the components touched by the edit are compiled and analyzed again.
+"""
+import numpy as np
+
+from logic.graph import get_constraint_graph
+from logic.linalg import import_scipy
+from logic.system import get_compiled_system
+
+# сингулярное число меньше этой доли наибольшего считается нулём
+RANK_TOL = 1e-9
+# для компонент с большим числом неизвестных ранг не считается, берётся структурный
+MAX_NUMERIC_VARS = 2000
+
+
+def get_matching_size(rows, cols, rows_num):
+    """
+    Size of the maximum matching of the bipartite graph rows - cols (Kuhn's augmenting paths).
+    """
+    adjacency = [[] for _ in range(rows_num)]
+    for row, col in set(zip(rows.tolist(), cols.tolist())):
+        adjacency[row].append(col)
+    matched = {}
+    size = 0
+    for root in range(rows_num):
+        # увеличивающий путь ищем обходом в глубину без рекурсии: [строка, её столбцы, выбранный столбец]
+        visited = set()
+        stack = [[root, iter(adjacency[root]), -1]]
+        while stack:
+            level = stack[-1]
+            for col in level[1]:
+                if col in visited:
+                    continue
+                visited.add(col)
+                level[2] = col
+                if col not in matched:
+                    for row, _, row_col in stack:
+                        matched[row_col] = row
+                    size += 1
+                    stack = []
+                    break
+                stack.append([matched[col], iter(adjacency[matched[col]]), -1])
+                break
+            else:
+                stack.pop()
+    return size
+
+
+def get_rank_spaces(j_matrix):
+    """
+    Rank of j_matrix (m x n), basis of its null space (n x (n - rank)) and the mask of the rows
+    that take part in a linear dependency (nonzero in the left null space).
+    """
+    rows_num, cols_num = j_matrix.shape
+    dense_linalg = import_scipy()['dense_linalg']
+    if dense_linalg is None:
+        u, singular, vt = np.linalg.svd(j_matrix, full_matrices=True)
+        rank = int((singular > RANK_TOL * max(singular.max(initial=0.), 1.)).sum())
+        return rank, vt[rank:].T, np.linalg.norm(u[:, rank:], axis=1) > np.sqrt(RANK_TOL)
+    # J^T P = Q R: первые rank столбцов перестановки - независимые строки J,
+    # остальные строки J выражаются через них коэффициентами R11^-1 R12
+    q, r, order = dense_linalg.qr(j_matrix.T, pivoting=True)
+    diagonal = np.abs(np.diagonal(r))
+    rank = int((diagonal > RANK_TOL * max(diagonal.max(initial=0.), 1.)).sum())
+    dependent = np.zeros(rows_num, dtype=bool)
+    if rank < rows_num:
+        coefficients = dense_linalg.solve_triangular(r[:rank, :rank], r[:rank, rank:])
+        dependent[order[rank:]] = True
+        dependent[order[:rank]] = np.abs(coefficients).max(axis=1, initial=0.) > np.sqrt(RANK_TOL)
+    return rank, q[:, rank:cols_num], dependent
+
+
+def get_ranks(matrices):
+    # ранги стопки матриц (N, R, K)
+    if not matrices.shape[0] or not matrices.shape[1] or not matrices.shape[2]:
+        return np.zeros(matrices.shape[0], dtype=np.int64)
+    singular = np.linalg.svd(matrices, compute_uv=False)
+    return (singular > RANK_TOL).sum(axis=1)
+
+
+class ComponentDof:
+    """
+    Degrees of freedom of one component:
+    dof, structural_dof - of all its points, redundant - ids of the constraints of the dependent equations,
+    redundant_num - number of the dependent equations (how many are extra),
+    structural_redundant - number of the equations left unmatched by the structure,
+    point_dof - point id -> free coordinates (0, 1 or 2), None if the component is too large
+    for the numerical analysis (then dof is the structural one and redundant is empty).
+    """
+
+    def __init__(self, storage, system):
+        self.point_ids = system.point_ids.tolist()
+        extra_free = np.flatnonzero(~system.var_fixed[system.var_num:]) + system.var_num
+        pattern_rows, pattern_cols = self.get_pattern(system)
+        matching = get_matching_size(pattern_rows, pattern_cols, system.lam_num)
+        self.structural_dof = system.var_num - matching + len(extra_free)
+        self.structural_redundant = system.lam_num - matching
+        self.dof = self.structural_dof
+        self.redundant = []
+        self.redundant_num = self.structural_redundant
+        self.point_dof = None
+        # движения координат каждой точки (len(point_ids), 2, число степеней свободы)
+        self.motions = None
+        if system.var_num > MAX_NUMERIC_VARS:
+            return
+
+        j_matrix, _ = system.get_residual_jf(system.get_coords(storage), np.zeros(system.var_num))
+        j_matrix = j_matrix if isinstance(j_matrix, np.ndarray) else j_matrix.toarray()
+        # строки разного масштаба (длины в квадрате, безразмерный угол) - нормируем
+        row_norms = np.linalg.norm(j_matrix, axis=1)
+        j_matrix = j_matrix / np.where(row_norms > 0, row_norms, 1.)[:, None]
+        rank, null_space, dependent = get_rank_spaces(j_matrix)
+        free_num = system.var_num - rank
+        self.dof = free_num + len(extra_free)
+        self.redundant_num = system.lam_num - rank
+
+        # ограничения уравнений, зависящих от других
+        for batch in system.batches:
+            selected = dependent[batch.lam_indexes].any(axis=1)
+            self.redundant.extend(np.asarray(batch.constraint_ids)[selected].tolist())
+        self.redundant.sort()
+
+        # базис движений: ядро J по неизвестным и по направлению на каждую свободную переменную
+        # только линейных ограничений; закреплённые переменные неподвижны
+        motions = np.zeros((len(system.var_fixed), self.dof))
+        motions[:system.var_num, :free_num] = null_space
+        motions[extra_free, free_num + np.arange(len(extra_free))] = 1.
+        self.motions = motions[system.coord_vars]
+        self.point_dof = dict(zip(self.point_ids, get_ranks(self.motions).tolist()))
+
+    @staticmethod
+    def get_pattern(system):
+        # структура J: уравнение - неизвестные, от которых оно зависит
+        indexes = [batch.get_residual_pattern_indexes() for batch in system.batches]
+        if not indexes:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return (np.concatenate([r for r, c in indexes]),
+                np.concatenate([c for r, c in indexes]) - system.lam_num)
+
+    def get_lines_dof(self, point_pairs):
+        """
+        Free coordinates of the lines by the ids of their ends (both in the component).
+        """
+        index = {point_id: i for i, point_id in enumerate(self.point_ids)}
+        rows = np.array([[index[p1_id], index[p2_id]] for p1_id, p2_id in point_pairs], dtype=np.int64)
+        return get_ranks(self.motions[rows.reshape(-1)].reshape((len(rows), 4, -1))).tolist()
+
+
+def get_component_key(storage, constraint_ids):
+    # те же ограничения с теми же значениями - та же система
+    values = storage.constraints.value[storage.constraints.get_rows(constraint_ids)]
+    return tuple(constraint_ids), tuple(np.nan_to_num(values).tolist())
+
+
+def analyze_dof(storage, cancel=None):
+    """
+    {'dof': degrees of freedom of the sketch, 'structural_dof',
+    'redundant': sorted ids of the constraints of the dependent equations,
+    'redundant_num': number of the extra equations,
+    'structural_redundant': number of the equations left without an unknown by the structure,
+    'points': point id -> free coordinates, 'lines': line id -> free coordinates of its ends,
+    'fully_defined': no freedom and no redundancy}
+    The points and the lines of too large components are not in 'points' and 'lines'.
+    cancel: threading.Event checked before analyzing every dirty component; if it is set, None is returned
+    and the components analyzed so far stay cached for the next call.
+    """
+    cache = storage.solver_cache.setdefault('dof', {})
+    keys = [get_component_key(storage, constraint_ids)
+            for constraint_ids in get_constraint_graph(storage).get_components()]
+    components = []
+    for key in keys:
+        component = cache.get(key)
+        if component is None:
+            if cancel is not None and cancel.is_set():
+                return None
+            # система та же, что у решателя, после решения компоненты она уже скомпилирована
+            component = ComponentDof(storage, get_compiled_system(storage, constraint_ids=list(key[0])))
+            cache[key] = component
+        components.append(component)
+    # удалённые и изменённые компоненты из кэша выбрасываем
+    storage.solver_cache['dof'] = dict(zip(keys, components))
+
+    # точки без ограничений свободны, у каждой две степени свободы
+    point_dof = {point_id: 2 for point_id in storage.points}
+    point_components = {}
+    for component in components:
+        point_components.update(dict.fromkeys(component.point_ids, component))
+        for point_id in component.point_ids:
+            point_dof.pop(point_id)
+        if component.point_dof is not None:
+            point_dof.update(component.point_dof)
+    free_points = len(storage.points) - len(point_components)
+
+    lines = {}
+    same_component = {}
+    for line_id, line in storage.lines.items():
+        p1_id, p2_id = line['p1_id'], line['p2_id']
+        component = point_components.get(p1_id)
+        if component is not None and component is point_components.get(p2_id) and component.motions is not None:
+            # концы в одной компоненте - их движения могут быть связаны
+            same_component.setdefault(id(component), (component, []))[1].append((line_id, (p1_id, p2_id)))
+        elif p1_id in point_dof and p2_id in point_dof:
+            lines[line_id] = point_dof[p1_id] + point_dof[p2_id]
+    for component, component_lines in same_component.values():
+        line_ids, point_pairs = zip(*component_lines)
+        lines.update(zip(line_ids, component.get_lines_dof(point_pairs)))
+
+    dof = sum(component.dof for component in components) + 2 * free_points
+    redundant = sorted(constraint_id for component in components for constraint_id in component.redundant)
+    redundant_num = sum(component.redundant_num for component in components)
+    return {'dof': dof,
+            'structural_dof': sum(component.structural_dof for component in components) + 2 * free_points,
+            'redundant': redundant,
+            'redundant_num': redundant_num,
+            'structural_redundant': sum(component.structural_redundant for component in components),
+            'points': point_dof,
+            'lines': lines,
+            'fully_defined': dof == 0 and not redundant_num}
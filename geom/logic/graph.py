@@ -0,0 +1,63 @@
+import numpy as np
+
+from logic.batch import get_point_rows
+
+
+class ConstraintGraph:
+    """
+    Points are the nodes of the graph and every constraint is a hyperedge over its points.
+    Connected components are found with union-find; a component is the set of constraints
+    that have to be solved together.
+    """
+
+    def __init__(self, storage):
+        self.version = storage.structure_version
+        self.parent = {}
+        constraints = storage.constraints
+        rows = constraints.get_alive_rows()
+        first_points = {}
+        for code in np.unique(constraints.kind[rows]):
+            selected = rows[constraints.kind[rows] == code]
+            point_ids = storage.points.row_ids[get_point_rows(storage, selected)]
+            for constraint_id, constraint_points in zip(constraints.row_ids[selected].tolist(), point_ids.tolist()):
+                first_points[constraint_id] = constraint_points[0]
+                for point_id in constraint_points[1:]:
+                    self.union(constraint_points[0], point_id)
+
+        self.components = {}
+        for constraint_id in constraints:
+            self.components.setdefault(self.find(first_points[constraint_id]), []).append(constraint_id)
+
+    def find(self, point_id):
+        root = self.parent.setdefault(point_id, point_id)
+        while root != self.parent[root]:
+            root = self.parent[root]
+        # сжатие путей
+        while point_id != root:
+            self.parent[point_id], point_id = root, self.parent[point_id]
+        return root
+
+    def union(self, point_id_1, point_id_2):
+        root_1 = self.find(point_id_1)
+        root_2 = self.find(point_id_2)
+        if root_1 != root_2:
+            self.parent[root_2] = root_1
+
+    def get_components(self, point_ids=None):
+        """
+        Constraint ids of every independent component (of the components touched by point_ids
+        if given), each in the storage order.
+        """
+        if point_ids is None:
+            roots = list(self.components)
+        else:
+            roots = {self.find(point_id) for point_id in point_ids if point_id in self.parent}
+        return [sorted(self.components[root]) for root in roots if root in self.components]
+
+
+def get_constraint_graph(storage):
+    graph = storage.solver_cache.get('graph')
+    if graph is None or graph.version != storage.structure_version:
+        graph = ConstraintGraph(storage)
+        storage.solver_cache['graph'] = graph
+    return graph
@@ -0,0 +1,86 @@
+import numpy as np
+
+from logic.linalg import Factorization, solve
+
+# пересобирать J не реже, чем раз в столько итераций
+MAX_AGE = 5
+# пересобирать J, если ||F|| за итерацию уменьшилась меньше, чем во столько раз
+STALL_RATIO = 0.5
+
+
+class JacobianReuse:
+    """
+    Policy of the frozen Jacobian mode of newtons_method: the LU factorization of J is
+    reused until it is max_age iterations old or an iteration reduces ||F|| by less than
+    stall_ratio; with broyden=True the reused inverse is corrected by Broyden's rank-one updates.
+    """
+
+    def __init__(self, max_age=MAX_AGE, stall_ratio=STALL_RATIO, broyden=True):
+        self.max_age = max_age
+        self.stall_ratio = stall_ratio
+        self.broyden = broyden
+
+
+class ExactJacobian:
+    """J is assembled and solved on every iteration."""
+
+    def start(self, get_jf, cur_v):
+        return get_jf(cur_v)
+
+    def advance(self, get_jf, new_v, delta_vector, f_vector):
+        # J, F in the new point after the step delta_vector
+        return get_jf(new_v)
+
+    def solve(self, j_matrix, rhs):
+        return solve(j_matrix, rhs)
+
+
+class FrozenJacobian(ExactJacobian):
+    def __init__(self, reuse):
+        self.reuse = reuse
+        self.factorization = None
+        self.age = 0
+        # H = J0^-1 + sum(a_i b_i^T)
+        self.corrections = []
+
+    def refactorize(self, get_jf, cur_v):
+        j_matrix, f_vector = get_jf(cur_v)
+        self.factorization = Factorization(j_matrix)
+        self.age = 0
+        self.corrections = []
+        return j_matrix, f_vector
+
+    def start(self, get_jf, cur_v):
+        return self.refactorize(get_jf, cur_v)
+
+    def advance(self, get_jf, new_v, delta_vector, f_vector):
+        _, new_f_vector = get_jf(new_v, jacobian=False)
+        if np.linalg.norm(new_f_vector) > self.reuse.stall_ratio * np.linalg.norm(f_vector) or \
+           self.age >= self.reuse.max_age:
+            return self.refactorize(get_jf, new_v)
+        if self.reuse.broyden:
+            self.add_broyden_correction(delta_vector, new_f_vector - f_vector)
+        return None, new_f_vector
+
+    def apply_inverse(self, rhs, transposed=False):
+        result = self.factorization.solve(rhs, transposed)
+        for a, b in self.corrections:
+            if transposed:
+                result += b * np.dot(a, rhs)
+            else:
+                result += a * np.dot(b, rhs)
+        return result
+
+    def solve(self, j_matrix, rhs):
+        self.age += 1
+        return self.apply_inverse(rhs)
+
+    def add_broyden_correction(self, delta_vector, delta_f):
+        # "хороший" метод Бройдена для обратной матрицы:
+        # H+ = H + (s - H y) s^T H / (s^T H y)
+        h_y = self.apply_inverse(delta_f)
+        denominator = np.dot(delta_vector, h_y)
+        if abs(denominator) <= np.finfo(float).eps * np.linalg.norm(delta_vector) * np.linalg.norm(h_y):
+            return
+        b = self.apply_inverse(delta_vector, transposed=True)
+        self.corrections.append(((delta_vector - h_y) / denominator, b))
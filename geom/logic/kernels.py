@@ -0,0 +1,143 @@
+import numpy as np
+
+# Каждое ограничение записано как g(u) = 0, где u = D @ p - разности координат его точек
+# p = [x1, y1, x2, y2, ...]. Ядро считает сразу для всех ограничений одного типа:
+# g (N, E), dg/du (N, E, U) и d2g/du2 (N, E, U, U) (None для линейных ограничений),
+# где N - число ограничений, E - число уравнений в ограничении, U - размер u.
+
+MIN_VALUE = 1e-5
+
+
+def diff_matrix(points_num, pairs):
+    # строки D: для пары (i, j) и координаты c разность p_j[c] - p_i[c]
+    diff = np.zeros((len(pairs) * 2, points_num * 2))
+    for k, (i, j) in enumerate(pairs):
+        for c in range(2):
+            diff[k * 2 + c, i * 2 + c] = -1.
+            diff[k * 2 + c, j * 2 + c] = 1.
+    return diff
+
+
+class Kind:
+    def __init__(self, name, points_num, equations_num, diff, kernel):
+        self.name = name
+        self.points_num = points_num
+        self.equations_num = equations_num
+        self.diff = diff
+        self.kernel = kernel
+
+
+def points_coincidence_kernel(u, values):
+    n = len(u)
+    g = u.reshape((n, 2))
+    gu = np.broadcast_to(np.eye(2), (n, 2, 2))
+    return g, gu, None
+
+
+def points_dist_kernel(u, values):
+    n = len(u)
+    g = u[:, 0] ** 2 + u[:, 1] ** 2 - values ** 2
+    gu = 2 * u
+    hu = np.broadcast_to(2 * np.eye(2), (n, 2, 2))
+    return g.reshape((n, 1)), gu.reshape((n, 1, 2)), hu.reshape((n, 1, 2, 2))
+
+
+def linear_kernel(u, values):
+    # горизонтальность и вертикальность: разность одной координаты равна нулю
+    n = len(u)
+    return u.reshape((n, 1)), np.ones((n, 1, 1)), None
+
+
+def parallel_kernel(u, values):
+    # u = (x12, y12, x34, y34)
+    n = len(u)
+    x12, y12, x34, y34 = u.T
+    g = x12 * y34 - x34 * y12
+    gu = np.stack([y34, -x34, -y12, x12], axis=1)
+    hu = np.zeros((n, 4, 4))
+    hu[:, 0, 3] = hu[:, 3, 0] = 1.
+    hu[:, 1, 2] = hu[:, 2, 1] = -1.
+    return g.reshape((n, 1)), gu.reshape((n, 1, 4)), hu.reshape((n, 1, 4, 4))
+
+
+def perpendicular_kernel(u, values):
+    n = len(u)
+    x12, y12, x34, y34 = u.T
+    g = x12 * x34 + y12 * y34
+    gu = np.stack([x34, y34, x12, y12], axis=1)
+    hu = np.zeros((n, 4, 4))
+    hu[:, 0, 2] = hu[:, 2, 0] = 1.
+    hu[:, 1, 3] = hu[:, 3, 1] = 1.
+    return g.reshape((n, 1)), gu.reshape((n, 1, 4)), hu.reshape((n, 1, 4, 4))
+
+
+def point_belongs_line_kernel(u, values):
+    # u = (x31, y31, x23, y23), точка 3 лежит на прямой через точки 1 и 2
+    n = len(u)
+    x31, y31, x23, y23 = u.T
+    g = x31 * y23 - x23 * y31
+    gu = np.stack([y23, -x23, -y31, x31], axis=1)
+    hu = np.zeros((n, 4, 4))
+    hu[:, 0, 3] = hu[:, 3, 0] = 1.
+    hu[:, 1, 2] = hu[:, 2, 1] = -1.
+    return g.reshape((n, 1)), gu.reshape((n, 1, 4)), hu.reshape((n, 1, 4, 4))
+
+
+def angle_kernel(u, values):
+    # 0 < angle < pi / 2
+    # g = (sin^2(a) (v1 . v2)^2 - cos^2(a) (v1 x v2)^2) / (|v1|^2 |v2|^2) = sin(a - phi) sin(a + phi),
+    # phi - угол между отрезками; без деления на длины g = 0 и у стянутого в точку отрезка,
+    # и решение стремилось укоротить стороны угла
+    n = len(u)
+    s = np.maximum(np.sin(values * np.pi / 180) ** 2, MIN_VALUE)
+    c = np.maximum(np.cos(values * np.pi / 180) ** 2, MIN_VALUE)
+    x, y, X, Y = u.T
+    g = s * (x ** 2 * X ** 2 + y ** 2 * Y ** 2) + 2 * x * X * y * Y - c * (x ** 2 * Y ** 2 + y ** 2 * X ** 2)
+    gu = np.stack([
+        2 * s * x * X ** 2 + 2 * X * y * Y - 2 * c * x * Y ** 2,
+        2 * s * y * Y ** 2 + 2 * x * X * Y - 2 * c * y * X ** 2,
+        2 * s * x ** 2 * X + 2 * x * y * Y - 2 * c * y ** 2 * X,
+        2 * s * y ** 2 * Y + 2 * x * X * y - 2 * c * x ** 2 * Y,
+    ], axis=1)
+    hu = np.empty((n, 4, 4))
+    hu[:, 0, 0] = 2 * s * X ** 2 - 2 * c * Y ** 2
+    hu[:, 1, 1] = 2 * s * Y ** 2 - 2 * c * X ** 2
+    hu[:, 2, 2] = 2 * s * x ** 2 - 2 * c * y ** 2
+    hu[:, 3, 3] = 2 * s * y ** 2 - 2 * c * x ** 2
+    hu[:, 0, 1] = hu[:, 1, 0] = 2 * X * Y
+    hu[:, 2, 3] = hu[:, 3, 2] = 2 * x * y
+    hu[:, 0, 2] = hu[:, 2, 0] = 4 * s * x * X + 2 * y * Y
+    hu[:, 1, 3] = hu[:, 3, 1] = 4 * s * y * Y + 2 * x * X
+    hu[:, 0, 3] = hu[:, 3, 0] = 2 * X * y - 4 * c * x * Y
+    hu[:, 1, 2] = hu[:, 2, 1] = 2 * x * Y - 4 * c * y * X
+
+    # деление на q = |v1|^2 |v2|^2: w = grad(ln q), grad(g / q) = (gu - g w) / q,
+    # hess(g / q) = (hu - gu w^T - w gu^T + g (w w^T - hess(ln q))) / q
+    norm_1 = np.maximum(x ** 2 + y ** 2, MIN_VALUE)
+    norm_2 = np.maximum(X ** 2 + Y ** 2, MIN_VALUE)
+    q = norm_1 * norm_2
+    w = np.stack([2 * x / norm_1, 2 * y / norm_1, 2 * X / norm_2, 2 * Y / norm_2], axis=1)
+    log_hess = np.zeros((n, 4, 4))
+    log_hess[:, :2, :2] = 2 * np.eye(2) / norm_1[:, None, None] - w[:, :2, None] * w[:, None, :2]
+    log_hess[:, 2:, 2:] = 2 * np.eye(2) / norm_2[:, None, None] - w[:, 2:, None] * w[:, None, 2:]
+    gw = gu[:, :, None] * w[:, None, :]
+    hu = (hu - gw - gw.transpose((0, 2, 1)) + g[:, None, None] * (w[:, :, None] * w[:, None, :] - log_hess)) / \
+        q[:, None, None]
+    gu = (gu - g[:, None] * w) / q[:, None]
+    g = g / q
+    return g.reshape((n, 1)), gu.reshape((n, 1, 4)), hu.reshape((n, 1, 4, 4))
+
+
+# точки ограничения упорядочены как в batch.get_point_indexes: сначала концы отрезков, потом точки
+KINDS = {kind.name: kind for kind in (
+    Kind('points_coincidence_constraint', 2, 2, diff_matrix(2, [(0, 1)]), points_coincidence_kernel),
+    Kind('points_dist_constraint', 2, 1, diff_matrix(2, [(0, 1)]), points_dist_kernel),
+    Kind('parallel_constraint', 4, 1, diff_matrix(4, [(0, 1), (2, 3)]), parallel_kernel),
+    Kind('perpendicular_constraint', 4, 1, diff_matrix(4, [(0, 1), (2, 3)]), perpendicular_kernel),
+    Kind('angle_constraint', 4, 1, diff_matrix(4, [(0, 1), (2, 3)]), angle_kernel),
+    Kind('horizontal_constraint', 2, 1, diff_matrix(2, [(0, 1)])[1:], linear_kernel),
+    Kind('vertical_constraint', 2, 1, diff_matrix(2, [(0, 1)])[:1], linear_kernel),
+    Kind('point_belongs_line_constraint', 3, 1, diff_matrix(3, [(0, 2), (2, 1)]), point_belongs_line_kernel),
+    # закреплённая точка всегда подставляется в batch.group_constraints, уравнений у неё нет
+    Kind('fix_point_constraint', 1, 0, np.zeros((0, 2)), None),
+)}
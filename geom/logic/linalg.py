@@ -0,0 +1,127 @@
+import numpy as np
+
+DENSE = 'dense'
+SPARSE = 'sparse'
+AUTO = 'auto'
+
+# начиная с такого размера системы разреженное LU быстрее плотного np.linalg.solve
+SPARSE_THRESHOLD = 200
+ERROR_NO_SCIPY = 'Для разреженного решателя нужен пакет scipy'
+
+SCIPY = {}
+
+
+def import_scipy():
+    # scipy импортируется при первом использовании: плотному решателю хватает numpy,
+    # а импорт scipy занимает большую часть времени запуска
+    if not SCIPY:
+        try:
+            from scipy import linalg as dense_linalg
+            from scipy import sparse
+            from scipy.sparse import linalg as sparse_linalg
+        except ImportError:  # без scipy доступен только плотный вариант
+            dense_linalg = sparse = sparse_linalg = None
+        SCIPY.update(dense_linalg=dense_linalg, sparse=sparse, sparse_linalg=sparse_linalg)
+    return SCIPY
+
+
+def choose_backend(size, backend=AUTO):
+    if backend == AUTO:
+        if size >= SPARSE_THRESHOLD and import_scipy()['sparse'] is not None:
+            return SPARSE
+        return DENSE
+    if backend not in (DENSE, SPARSE):
+        raise ValueError('unknown backend: {}'.format(backend))
+    if backend == SPARSE and import_scipy()['sparse'] is None:
+        raise RuntimeError(ERROR_NO_SCIPY)
+    return backend
+
+
+class JacobianPattern:
+    """
+    Fixed sparsity pattern of the Jacobian.
+
+    Row and column indexes of the COO triplets are known before the first Newton
+    iteration and do not change afterwards, so duplicates are merged and the CSC
+    structure is computed once; every iteration only sums the values into it.
+    The matrix is size x size or size x cols_num; the backend is chosen by size.
+    """
+
+    def __init__(self, rows, cols, size, backend=AUTO, cols_num=None):
+        self.size = size
+        self.cols_num = size if cols_num is None else cols_num
+        self.backend = choose_backend(size, backend)
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        if self.backend == DENSE:
+            self.keys = rows * self.cols_num + cols
+            return
+        # column-major keys, so that the unique keys are already in CSC order
+        keys, self.inverse = np.unique(cols * size + rows, return_inverse=True)
+        self.inverse = self.inverse.ravel()
+        self.nnz = len(keys)
+        self.indices = keys % size
+        self.indptr = np.zeros(self.cols_num + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // size, minlength=self.cols_num), out=self.indptr[1:])
+
+    def get_nnz(self):
+        # число ненулевых позиций без повторов, для телеметрии
+        if self.backend == DENSE:
+            return len(np.unique(self.keys))
+        return self.nnz
+
+    def assemble(self, vals):
+        if self.backend == DENSE:
+            flat = np.bincount(self.keys, weights=vals, minlength=self.size * self.cols_num)
+            return flat.reshape((self.size, self.cols_num))
+        data = np.bincount(self.inverse, weights=vals, minlength=self.nnz)
+        return import_scipy()['sparse'].csc_matrix((data, self.indices, self.indptr),
+                                                   shape=(self.size, self.cols_num))
+
+
+def add_to_diagonal(matrix, value):
+    if isinstance(matrix, np.ndarray):
+        return matrix + value * np.eye(matrix.shape[0])
+    return matrix + value * import_scipy()['sparse'].identity(matrix.shape[0], format='csc')
+
+
+def splu(j_matrix):
+    scipy = import_scipy()
+    try:
+        return scipy['sparse_linalg'].splu(scipy['sparse'].csc_matrix(j_matrix))
+    except RuntimeError as e:
+        # splu сообщает о вырожденной матрице через RuntimeError
+        raise np.linalg.LinAlgError(str(e))
+
+
+def solve(j_matrix, rhs):
+    if isinstance(j_matrix, np.ndarray):
+        return np.linalg.solve(j_matrix, rhs)
+    return splu(j_matrix).solve(rhs)
+
+
+class Factorization:
+    """
+    LU factorization of J that can be reused for several right-hand sides,
+    solve(rhs, transposed=True) solves J^T x = rhs.
+    """
+
+    def __init__(self, j_matrix):
+        self.j_matrix = j_matrix
+        self.sparse_lu = None
+        self.dense_lu = None
+        self.dense_linalg = import_scipy()['dense_linalg']
+        if not isinstance(j_matrix, np.ndarray):
+            self.sparse_lu = splu(j_matrix)
+        elif self.dense_linalg is not None:
+            self.dense_lu = self.dense_linalg.lu_factor(j_matrix, check_finite=False)
+            if np.any(np.diagonal(self.dense_lu[0]) == 0):
+                raise np.linalg.LinAlgError('Singular matrix')
+
+    def solve(self, rhs, transposed=False):
+        if self.sparse_lu is not None:
+            return self.sparse_lu.solve(rhs, trans='T' if transposed else 'N')
+        if self.dense_lu is not None:
+            return self.dense_linalg.lu_solve(self.dense_lu, rhs, trans=1 if transposed else 0, check_finite=False)
+        # без scipy разложение не сохранить, решаем заново
+        return np.linalg.solve(self.j_matrix.T if transposed else self.j_matrix, rhs)
@@ -1,26 +1,278 @@
+import time
+
 import numpy as np
 
+from logic.jacobian import ExactJacobian, FrozenJacobian
+from logic.linalg import add_to_diagonal, solve
+from logic.telemetry import ITERATION_END, ITERATION_START, NEWTON_END, TimedJF
+
 EPS = 1e-9
 MAX_ITER = 10000
+# демпфированным методам столько итераций не нужно, если не сошлись - система несовместна
+DAMPED_MAX_ITER = 200
 ERROR_MAX_ITER = "Превышено число итераций метода Ньютона"
+ERROR_STALLED = "Метод Ньютона не может уменьшить невязку"
+ERROR_CANCELLED = "Решение прервано"
 
+NEWTON = 'newton'
+LINE_SEARCH = 'line_search'
+DOGLEG = 'dogleg'
+LEVENBERG_MARQUARDT = 'lm'
+LEAST_NORM = 'least_norm'
+DEFAULT_STRATEGY = LINE_SEARCH
+# стратегии без лямбд: v - только координаты, F - уравнения ограничений g, J - их производные (m x n)
+RESIDUAL_STRATEGIES = {LEAST_NORM}
 
-def newtons_method(get_jf, start_v):
-    k = 0
-    cur_v = start_v
-    while k < MAX_ITER:
-        j_matrix, f_vector = get_jf(cur_v)
+# backtracking: шаг принимается при ||F(v + t * delta)|| <= (1 - LS_ALPHA * t) * max ||F||
+# за последние LS_WINDOW итераций (немонотонный вариант: ||F|| системы с лямбда плохо
+# масштабирована, и строгое убывание заставляет ползти вдоль оврага)
+LS_ALPHA = 1e-4
+LS_MIN_T = 1e-4
+LS_WINDOW = 5
+# Levenberg-Marquardt: начальное mu относительно диагонали J^T J
+LM_MU_START = 1e-6
+# нижняя граница множителя mu после удачного шага, 1/3 у Нильсена сходится слишком медленно
+LM_MIN_DECREASE = 0.1
+# регуляризация J J^T относительно её диагонали: избыточные ограничения дают вырожденную матрицу
+LEAST_NORM_REG = 1e-12
+
+
+class SolveCancelled(RuntimeError):
+    """
+    The solve was cancelled or ran out of time.
+    delta_x - the best iterate (the least ||F||), residual_norm - its ||F||,
+    point_ids - the points moved to the best iterates by recalculate_point_positions
+    """
+
+    def __init__(self, message=ERROR_CANCELLED, delta_x=None, residual_norm=None, point_ids=None):
+        RuntimeError.__init__(self, message)
+        self.delta_x = delta_x
+        self.residual_norm = residual_norm
+        self.point_ids = point_ids
+
+
+def newton_step(get_jf, cur_v, j_matrix, f_vector, state):
+    jacobian = state['jacobian']
+    delta_vector = jacobian.solve(j_matrix, -f_vector)
+    j_matrix, f_vector = jacobian.advance(get_jf, cur_v + delta_vector, delta_vector, f_vector)
+    return delta_vector, j_matrix, f_vector
+
+
+def get_step_length(get_jf, cur_v, delta_vector, f_vector, state):
+    history = state.setdefault('history', [])
+    history.append(np.linalg.norm(f_vector))
+    f_norm = max(history[-LS_WINDOW:])
+    t = 1.
+    while t >= LS_MIN_T:
+        _, trial_f = get_jf(cur_v + t * delta_vector, jacobian=False)
+        if np.linalg.norm(trial_f) <= (1 - LS_ALPHA * t) * f_norm:
+            break
+        t /= 2
+    else:
+        # убывания не нашли - делаем полный шаг Ньютона, маленький шаг выглядел бы как сходимость
+        t = 1.
+    return t
+
+
+def line_search_step(get_jf, cur_v, j_matrix, f_vector, state):
+    jacobian = state['jacobian']
+    delta_vector = jacobian.solve(j_matrix, -f_vector)
+    delta_vector = get_step_length(get_jf, cur_v, delta_vector, f_vector, state) * delta_vector
+    j_matrix, f_vector = jacobian.advance(get_jf, cur_v + delta_vector, delta_vector, f_vector)
+    return delta_vector, j_matrix, f_vector
+
+
+def least_norm_step(get_jf, cur_v, j_matrix, f_vector, state):
+    # шаг Гаусса-Ньютона наименьшей нормы: J dv = -F, dv = J^T y, (J J^T) y = -F;
+    # система размера m (уравнения), а не m + n, и недоопределённость ей не мешает
+    normal_matrix = j_matrix @ j_matrix.T
+    scale = max(normal_matrix.diagonal().max(initial=0.), 1.)
+    delta_vector = j_matrix.T @ solve(add_to_diagonal(normal_matrix, LEAST_NORM_REG * scale), -f_vector)
+    delta_vector = get_step_length(get_jf, cur_v, delta_vector, f_vector, state) * delta_vector
+    j_matrix, f_vector = get_jf(cur_v + delta_vector)
+    return delta_vector, j_matrix, f_vector
+
+
+def get_gain_ratio(f_vector, trial_f, predicted_f):
+    # отношение фактического уменьшения ||F||^2 к предсказанному линейной моделью,
+    # None - модель не предсказывает уменьшения (градиент ||F||^2 равен нулю с точностью округления)
+    predicted = np.dot(f_vector, f_vector) - np.dot(predicted_f, predicted_f)
+    if predicted <= 0:
+        return None
+    return (np.dot(f_vector, f_vector) - np.dot(trial_f, trial_f)) / predicted
+
+
+def reject_step(state, rho, step_norm, cur_v, j_matrix, f_vector):
+    # дальнейшие отвергнутые шаги ничего не дадут: убывания нет даже в модели
+    # или область доверия (рост mu) сжала шаг до EPS
+    if rho is None or step_norm <= EPS:
+        # полный шаг Ньютона не длиннее EPS относительно координат - невязка упёрлась в ошибку
+        # округления (у больших эскизов она выше EPS), иначе это тупик
         try:
-            delta_vector = np.linalg.solve(j_matrix, -f_vector)
-        except np.linalg.LinAlgError as e:
-            raise
+            newton_norm = np.linalg.norm(solve(j_matrix, -f_vector))
+        except np.linalg.LinAlgError:
+            newton_norm = np.inf
+        converged = newton_norm <= EPS * max(1., np.linalg.norm(cur_v))
+        state['converged' if converged else 'stalled'] = True
+    return None
+
+
+def dogleg_step(get_jf, cur_v, j_matrix, f_vector, state):
+    gradient = j_matrix.T @ f_vector
+    j_gradient = j_matrix @ gradient
+    steepest = -np.dot(gradient, gradient) / max(np.dot(j_gradient, j_gradient), np.finfo(float).tiny) * gradient
+    try:
+        newton = solve(j_matrix, -f_vector)
+    except np.linalg.LinAlgError:
+        newton = None
+    if 'radius' not in state:
+        state['radius'] = max(np.linalg.norm(newton if newton is not None else steepest), EPS)
+    radius = state['radius']
+
+    if newton is not None and np.linalg.norm(newton) <= radius:
+        delta_vector = newton
+    elif newton is None or np.linalg.norm(steepest) >= radius:
+        delta_vector = steepest * (radius / max(np.linalg.norm(steepest), np.finfo(float).tiny))
+    else:
+        # точка на отрезке steepest -> newton на границе доверительной области
+        diff = newton - steepest
+        a = np.dot(diff, diff)
+        b = 2 * np.dot(steepest, diff)
+        c = np.dot(steepest, steepest) - radius ** 2
+        tau = (-b + np.sqrt(b ** 2 - 4 * a * c)) / (2 * a)
+        delta_vector = steepest + tau * diff
+
+    _, trial_f = get_jf(cur_v + delta_vector, jacobian=False)
+    rho = get_gain_ratio(f_vector, trial_f, f_vector + j_matrix @ delta_vector)
+    step_norm = np.linalg.norm(delta_vector)
+    if rho is None or rho <= 0:
+        state['radius'] = step_norm / 4
+        return reject_step(state, rho, step_norm, cur_v, j_matrix, f_vector), j_matrix, f_vector
+    if rho < 0.25:
+        state['radius'] = step_norm / 4
+    elif rho > 0.75 and step_norm >= 0.99 * radius:
+        state['radius'] = radius * 2
+    j_matrix, f_vector = get_jf(cur_v + delta_vector)
+    return delta_vector, j_matrix, f_vector
+
+
+def levenberg_marquardt_step(get_jf, cur_v, j_matrix, f_vector, state):
+    normal_matrix = j_matrix.T @ j_matrix
+    gradient = j_matrix.T @ f_vector
+    if 'mu' not in state:
+        state['mu'] = LM_MU_START * max(normal_matrix.diagonal().max(initial=0.), 1.)
+        state['nu'] = 2.
+    delta_vector = solve(add_to_diagonal(normal_matrix, state['mu']), -gradient)
+
+    _, trial_f = get_jf(cur_v + delta_vector, jacobian=False)
+    rho = get_gain_ratio(f_vector, trial_f, f_vector + j_matrix @ delta_vector)
+    if rho is None or rho <= 0:
+        state['mu'] *= state['nu']
+        state['nu'] *= 2
+        return reject_step(state, rho, np.linalg.norm(delta_vector), cur_v, j_matrix, f_vector), j_matrix, f_vector
+    state['mu'] *= max(LM_MIN_DECREASE, 1 - (2 * rho - 1) ** 3)
+    state['nu'] = 2.
+    j_matrix, f_vector = get_jf(cur_v + delta_vector)
+    return delta_vector, j_matrix, f_vector
+
+
+STRATEGIES = {
+    NEWTON: newton_step,
+    LINE_SEARCH: line_search_step,
+    DOGLEG: dogleg_step,
+    LEVENBERG_MARQUARDT: levenberg_marquardt_step,
+    LEAST_NORM: least_norm_step,
+}
+
+
+def newtons_method(get_jf, start_v, strategy=DEFAULT_STRATEGY, max_iter=None, reuse=None, monitor=None,
+                   cancel=None, deadline=None):
+    """
+    get_jf(v, jacobian=True) -> J, F; with jacobian=False only F is needed (J may be None)
+    strategy: 'newton' - pure Newton step, 'line_search' - backtracking on ||F||,
+    'dogleg' - trust region dogleg, 'lm' - Levenberg-Marquardt,
+    'least_norm' - minimum norm Gauss-Newton step with backtracking, for get_jf of RESIDUAL_STRATEGIES
+    reuse: jacobian.JacobianReuse policy of the frozen Jacobian (Broyden) mode,
+    only for 'newton' and 'line_search'; J is rebuilt every iteration by default
+    monitor: telemetry callable monitor(event, data), see logic.telemetry
+    cancel: threading.Event checked before every iteration
+    deadline: time.perf_counter() value after which no more iterations are started
+    SolveCancelled with the best iterate is raised when cancel is set or the deadline has passed
+    Converges when ||F|| <= EPS or the step is not longer than EPS; RuntimeError(ERROR_STALLED) is raised
+    when 'dogleg' or 'lm' cannot decrease ||F|| any more and the Newton step is longer than EPS * ||v||.
+    """
+    step = STRATEGIES.get(strategy)
+    if step is None:
+        raise ValueError('unknown strategy: {}'.format(strategy))
+    if reuse is not None and strategy not in (NEWTON, LINE_SEARCH):
+        raise ValueError('jacobian reuse is not supported by strategy: {}'.format(strategy))
+    if max_iter is None:
+        max_iter = MAX_ITER if strategy == NEWTON else DAMPED_MAX_ITER
+    if monitor is not None:
+        get_jf = TimedJF(get_jf)
+    state = {'jacobian': ExactJacobian() if reuse is None else FrozenJacobian(reuse)}
+    k = 0
+    cur_v = np.array(start_v, dtype=np.double)
+    j_matrix, f_vector = state['jacobian'].start(get_jf, cur_v)
+    interruptible = cancel is not None or deadline is not None
+    if interruptible:
+        best_v, best_norm = cur_v.copy(), np.linalg.norm(f_vector)
+    while k < max_iter:
+        if interruptible:
+            f_norm = np.linalg.norm(f_vector)
+            if f_norm < best_norm:
+                best_v, best_norm = cur_v.copy(), f_norm
+            if (cancel is not None and cancel.is_set()) or (deadline is not None and time.perf_counter() > deadline):
+                if monitor is not None:
+                    monitor(NEWTON_END, {'iterations': k, 'converged': False, 'residual_norm': float(best_norm)})
+                raise SolveCancelled(ERROR_CANCELLED, best_v, float(best_norm))
+        if not len(f_vector) or np.linalg.norm(f_vector) <= EPS:
+            # уже решено: у демпфированных стратегий шаг при F = 0 не предсказывает убывания и отвергается
+            return report_converged(monitor, k, cur_v, f_vector)
+        k = k + 1
+        if monitor is not None:
+            monitor(ITERATION_START, {'iteration': k})
+            assembly_start = get_jf.seconds
+            step_start = time.perf_counter()
+        delta_vector, j_matrix, f_vector = step(get_jf, cur_v, j_matrix, f_vector, state)
+        if delta_vector is None:
+            # шаг отвергнут, область доверия или mu уже изменены
+            if monitor is not None:
+                report_iteration(monitor, k, False, f_vector, 0., get_jf.seconds - assembly_start, step_start)
+            if state.get('converged'):
+                return report_converged(monitor, k, cur_v, f_vector)
+            if state.get('stalled'):
+                if monitor is not None:
+                    monitor(NEWTON_END, {'iterations': k, 'converged': False,
+                                         'residual_norm': float(np.linalg.norm(f_vector))})
+                raise RuntimeError(ERROR_STALLED)
+            continue
 
         cur_v += delta_vector
 
         S = np.sqrt(np.sum(delta_vector ** 2))
-        print('S = {}'.format(S))
+        if monitor is not None:
+            report_iteration(monitor, k, True, f_vector, S, get_jf.seconds - assembly_start, step_start)
         if S <= EPS:
-            print('--------------------------------')
-            return cur_v
-        k = k + 1
+            return report_converged(monitor, k, cur_v, f_vector)
+    if monitor is not None:
+        monitor(NEWTON_END, {'iterations': k, 'converged': False, 'residual_norm': float(np.linalg.norm(f_vector))})
     raise RuntimeError(ERROR_MAX_ITER)
+
+
+def report_converged(monitor, k, cur_v, f_vector):
+    if monitor is not None:
+        monitor(NEWTON_END, {'iterations': k, 'converged': True, 'residual_norm': float(np.linalg.norm(f_vector))})
+    return cur_v
+
+
+def report_iteration(monitor, k, accepted, f_vector, step_norm, assembly_time, step_start):
+    step_time = time.perf_counter() - step_start
+    monitor(ITERATION_END, {
+        'iteration': k,
+        'accepted': accepted,
+        'residual_norm': float(np.linalg.norm(f_vector)),
+        'step_norm': float(step_norm),
+        'assembly_s': assembly_time,
+        'solve_s': step_time - assembly_time,
+    })
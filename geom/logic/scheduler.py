@@ -0,0 +1,92 @@
+"""
+Task queue of LogicsObject. The GUI thread puts tasks, the logics thread takes them one by one.
+"""
+import threading
+from collections import deque
+
+from task import Task
+
+MAX_TASKS = 32
+# задачи перемещения и параметр с id перемещаемого объекта
+MOVE_TASKS = {'move_point': 'point_id', 'move_line': 'line_id'}
+
+
+def can_coalesce(task, new_task):
+    key = MOVE_TASKS.get(task.name)
+    return key is not None and new_task.name == task.name and new_task.params.get(key) == task.params.get(key)
+
+
+def coalesce(task, new_task):
+    # два перемещения одного объекта подряд - одно перемещение на сумму векторов,
+    # остальные параметры (например, drag) берутся у нового;
+    # перемещение от положения до перетаскивания (origin) уже включает все кадры перед ним
+    if new_task.params.get('origin') is not None:
+        return new_task
+    move_vector = task.params['move_vector'] + new_task.params['move_vector']
+    return Task(name=task.name, params=dict(new_task.params, move_vector=move_vector))
+
+
+class TaskScheduler:
+    """
+    Bounded queue of tasks:
+    - a move of the same object as the last queued move is added to it instead of taking a slot;
+    - a move of the object being moved right now cancels the running solve, the next one solves
+      the same points again from the summed position; drag frames (params['drag']) do not cancel,
+      the running frame has its own time budget and the frames waiting behind it are merged;
+    - the worker waits on a condition and wakes up as soon as a task is put;
+    - pending is set while the queue is not empty, the work done between tasks stops on it.
+    """
+
+    def __init__(self, maxlen=MAX_TASKS):
+        self.tasks = deque()
+        self.maxlen = maxlen
+        self.condition = threading.Condition()
+        self.current = None
+        self.cancel = threading.Event()
+        self.pending = threading.Event()
+
+    def put(self, task):
+        """
+        Returns False if the queue is full and the task is dropped.
+        """
+        with self.condition:
+            if self.tasks and can_coalesce(self.tasks[-1], task):
+                self.tasks[-1] = coalesce(self.tasks[-1], task)
+                self.pending.set()
+                return True
+            if len(self.tasks) >= self.maxlen:
+                return False
+            if (not self.tasks and self.current is not None and can_coalesce(self.current, task) and
+                    not task.params.get('drag', False)):
+                self.cancel.set()
+            self.tasks.append(task)
+            self.pending.set()
+            self.condition.notify()
+            return True
+
+    def get(self):
+        """
+        Waits for the next task, returns it and its cancel event.
+        """
+        with self.condition:
+            while not self.tasks:
+                self.condition.wait()
+            self.current = self.tasks.popleft()
+            if not self.tasks:
+                self.pending.clear()
+            self.cancel = threading.Event()
+            return self.current, self.cancel
+
+    def cancel_current(self):
+        # прерывает идущее решение, задачи в очереди остаются
+        with self.condition:
+            if self.current is not None:
+                self.cancel.set()
+
+    def done(self):
+        with self.condition:
+            self.current = None
+
+    def __len__(self):
+        with self.condition:
+            return len(self.tasks)
@@ -0,0 +1,246 @@
+from contextlib import contextmanager
+
+import storage
+from constraint import Constraint
+from logic.batch import get_point_indexes
+from logic.constraints import recalculate_point_positions
+from logic.dof import analyze_dof
+from logic.newton import SolveCancelled
+from logic.warm_start import get_warm_start
+
+
+class Sketch:
+    """
+    Points, lines and constraints of a sketch and the editing operations on them.
+    Uses only numpy, the Qt application works with it through LogicsObject.
+    """
+
+    def __init__(self, storage_=None):
+        self.storage = storage_ if storage_ is not None else storage.Storage()
+        # открытая транзакция: состояние хранилища на её начало и точки для решения
+        self.transaction = None
+
+    def begin(self):
+        """
+        Starts a transaction: the edits change the storage without solving,
+        commit() solves once for all of them, rollback() restores the storage.
+        """
+        if self.transaction is not None:
+            raise RuntimeError('transaction is already open')
+        self.transaction = {'state': self.storage.get_state(), 'point_ids': set()}
+
+    def commit(self, **params):
+        """
+        Solves the components touched by the transaction, params - as in recalculate_point_positions.
+        If the solve fails, the transaction is rolled back and the error is raised.
+        Returns {'point_ids': ids of the moved points and of the points moved by the solve}.
+        """
+        transaction = self.get_transaction()
+        point_ids = sorted(point_id for point_id in transaction['point_ids'] if point_id in self.storage.points)
+        try:
+            changed = recalculate_point_positions(self.storage, point_ids=point_ids, **params) if point_ids else []
+        except RuntimeError:
+            self.rollback()
+            raise
+        self.transaction = None
+        return {'point_ids': sorted(set(changed) | set(point_ids))}
+
+    def rollback(self):
+        transaction = self.get_transaction()
+        self.transaction = None
+        self.storage.set_state(transaction['state'])
+
+    def get_transaction(self):
+        if self.transaction is None:
+            raise RuntimeError('no open transaction')
+        return self.transaction
+
+    @contextmanager
+    def batch(self, **params):
+        """
+        with sketch.batch() as result: ... - begin(), commit(**params) at the end of the block
+        with the result of commit in result, rollback() if the block raises.
+        """
+        self.begin()
+        result = {}
+        try:
+            yield result
+        except BaseException:
+            self.rollback()
+            raise
+        result.update(self.commit(**params))
+
+    def add_point_to_storage(self, x, y):
+        point_id = self.storage.points.add(x, y)
+        self.storage.structure_changed()
+        return point_id
+
+    def add_line_to_storage(self, line):
+        line_id = self.storage.lines.add(line['p1_id'], line['p2_id'])
+        self.storage.structure_changed()
+        return line_id
+
+    def add_constraint_to_storage(self, constraint):
+        constraint_id = self.storage.constraints.find(constraint)
+        if constraint_id is not None:
+            if self.storage.constraints[constraint_id].value:
+                self.storage.constraints.set_value(constraint_id, constraint.value)
+                self.storage.structure_changed()
+                get_warm_start(self.storage).discard(constraint_id)
+            return constraint_id
+
+        constraint_id = self.storage.constraints.add(constraint)
+        self.storage.structure_changed()
+        return constraint_id
+
+    def delete_point_from_storage(self, point_id):
+        self.storage.points.remove(point_id)
+        self.storage.structure_changed()
+        get_warm_start(self.storage).discard_point(point_id)
+
+    def delete_line_from_storage(self, line_id):
+        line_to_delete = self.storage.lines.pop(line_id)
+        self.storage.structure_changed()
+        self.delete_point_from_storage(line_to_delete['p1_id'])
+        self.delete_point_from_storage(line_to_delete['p2_id'])
+
+    def delete_constraint_from_storage(self, constraint_id):
+        if constraint_id in self.storage.constraints:
+            self.storage.constraints.pop(constraint_id)
+            self.storage.structure_changed()
+            get_warm_start(self.storage).discard(constraint_id)
+
+    def add_line(self, x1, y1, x2, y2):
+        first_id = self.add_point_to_storage(x1, y1)
+        second_id = self.add_point_to_storage(x2, y2)
+        line_id = self.add_line_to_storage({'p1_id': first_id, 'p2_id': second_id})
+        return {'p1_id': first_id, 'p2_id': second_id, 'line_id': line_id}
+
+    def add_constraint(self, constraint, **params):
+        """
+        params - parameters of recalculate_point_positions, e.g. cancel and deadline.
+        If the solve fails or is cancelled (SolveCancelled), the storage is restored and the error is raised.
+        """
+        if self.transaction is not None:
+            constraint_id = self.add_constraint_to_storage(constraint)
+            self.transaction['point_ids'].update(get_point_indexes(self.storage, constraint_id))
+            return {'constraint_id': constraint_id, 'point_ids': []}
+        # своя транзакция: откат восстанавливает и прежнее значение уже существующего ограничения
+        with self.batch(**params) as result:
+            constraint_id = self.add_constraint(constraint)['constraint_id']
+        return {'constraint_id': constraint_id, 'point_ids': result['point_ids']}
+
+    def get_constraints_by_obj(self, obj_type, obj_id):
+        # ограничения линии - и на неё саму, и на её точки
+        constraint_ids = set(self.storage.constraints.get_by_object(obj_type, obj_id))
+        if obj_type == 'line':
+            for point_id in self.storage.lines.get_point_ids(obj_id):
+                constraint_ids.update(self.storage.constraints.get_by_object('point', point_id))
+        return sorted(constraint_ids)
+
+    def delete_line(self, line_id):
+        constraints = self.get_constraints_by_obj('line', line_id)
+        for constraint_id in constraints:
+            self.delete_constraint_from_storage(constraint_id)
+        self.delete_line_from_storage(line_id)
+        return {'line_id': line_id, 'constraints': constraints}
+
+    def delete_lines(self, line_ids):
+        constraints = []
+        for line_id in line_ids:
+            constraints.extend(self.delete_line(line_id)['constraints'])
+        return {'line_ids': list(line_ids), 'constraints': constraints}
+
+    def delete_constraint(self, constraint_id):
+        self.delete_constraint_from_storage(constraint_id)
+        return {'constraint_id': constraint_id}
+
+    # params - параметры recalculate_point_positions, например cancel (threading.Event) и extrapolate
+    # при перетаскивании; прерванное решение оставляет точки сдвинутыми, их решит следующее перемещение
+    def move_line(self, line_id, dx, dy, **params):
+        return self.move_points(self.storage.lines.get_point_ids(line_id), dx, dy, **params)
+
+    def move_point(self, point_id, dx, dy, **params):
+        return self.move_points([point_id], dx, dy, **params)
+
+    def move_points(self, point_ids, dx, dy, **params):
+        coords = self.storage.points.get_coords(point_ids)
+        for point_id in point_ids:
+            self.storage.points.move(point_id, dx, dy)
+        try:
+            return self.solve_moved(point_ids, **params)
+        except SolveCancelled:
+            raise
+        except RuntimeError:
+            # несовместное перемещение (например, закреплённой точки, связанной с другой закреплённой)
+            # не остаётся в хранилище, иначе не решилась бы и вся компонента после него
+            self.storage.points.set_coords(point_ids, coords)
+            raise
+
+    def solve_moved(self, point_ids, **params):
+        """
+        Returns {'point_ids': ids of the moved points and of the points moved by the solve}.
+        SolveCancelled gets the same ids in point_ids.
+        In a transaction the points are only remembered for commit().
+        """
+        if self.transaction is not None:
+            self.transaction['point_ids'].update(point_ids)
+            return {'point_ids': sorted(point_ids)}
+        try:
+            changed = recalculate_point_positions(self.storage, point_ids=point_ids, **params)
+        except SolveCancelled as e:
+            e.point_ids = sorted(set(e.point_ids or ()) | set(point_ids))
+            raise
+        return {'point_ids': sorted(set(changed) | set(point_ids))}
+
+    def solve(self, **params):
+        # параметры - как у recalculate_point_positions, по умолчанию решается весь эскиз
+        return recalculate_point_positions(self.storage, **params)
+
+    def get_dof(self, cancel=None):
+        # степени свободы и избыточные ограничения, см. logic.dof.analyze_dof
+        return analyze_dof(self.storage, cancel)
+
+    def load(self, data):
+        """
+        Adds the points, lines and constraints of data (the format of to_dict) without solving.
+        Returns the ids of the sketch by the ids in data: {'points': {...}, 'lines': {...}, 'constraints': {...}}
+        """
+        ids = {'points': {}, 'lines': {}, 'constraints': {}}
+        for point in data.get('points', []):
+            ids['points'][point['id']] = self.add_point_to_storage(point['x'], point['y'])
+        for line in data.get('lines', []):
+            ids['lines'][line['id']] = self.add_line_to_storage({'p1_id': ids['points'][line['p1_id']],
+                                                                 'p2_id': ids['points'][line['p2_id']]})
+        for constraint in data.get('constraints', []):
+            objects = [{'type': obj['type'], 'obj': ids[obj['type'] + 's'][obj['obj']]}
+                       for obj in constraint['objects']]
+            constraint_id = self.add_constraint_to_storage(Constraint(constraint['name'], objects,
+                                                                      constraint.get('value')))
+            ids['constraints'][constraint.get('id', constraint_id)] = constraint_id
+        return ids
+
+    def to_dict(self, ids=None):
+        """
+        {'points': [{'id', 'x', 'y'}], 'lines': [{'id', 'p1_id', 'p2_id'}],
+        'constraints': [{'id', 'name', 'objects', 'value'}]}
+        ids: the result of load, to write the ids of the loaded data instead of the ids of the sketch
+        """
+        names = {kind: {} for kind in ('points', 'lines', 'constraints')}
+        for kind, mapping in (ids or {}).items():
+            names[kind] = {sketch_id: data_id for data_id, sketch_id in mapping.items()}
+
+        def get_id(kind, sketch_id):
+            return names[kind].get(sketch_id, sketch_id)
+
+        points = [{'id': get_id('points', point_id), 'x': float(x), 'y': float(y)}
+                  for point_id, (x, y) in self.storage.points.items()]
+        lines = [{'id': get_id('lines', line_id), 'p1_id': get_id('points', line['p1_id']),
+                  'p2_id': get_id('points', line['p2_id'])}
+                 for line_id, line in self.storage.lines.items()]
+        constraints = [{'id': get_id('constraints', constraint_id), 'name': constraint.name,
+                        'objects': [{'type': obj['type'], 'obj': get_id(obj['type'] + 's', obj['obj'])}
+                                    for obj in constraint.objects],
+                        'value': constraint.value}
+                       for constraint_id, constraint in self.storage.constraints.items()]
+        return {'points': points, 'lines': lines, 'constraints': constraints}
@@ -0,0 +1,161 @@
+"""
+Uniform grids over the points and the line segments of the storage for picking, snapping and box selection.
+"""
+import numpy as np
+
+# в среднем столько точек на ячейку сетки точек
+POINTS_PER_CELL = 2
+# элемент, покрывающий больше ячеек (длинный отрезок), не раскладывается по ячейкам,
+# а проверяется при каждом запросе
+MAX_ITEM_CELLS = 64
+MIN_CELL_SIZE = 1e-6
+
+
+def get_cell_size(coords):
+    # ячейка с POINTS_PER_CELL точками при равномерном распределении по охватывающему прямоугольнику
+    if not len(coords):
+        return 1.
+    width, height = coords.max(axis=0) - coords.min(axis=0)
+    per_point = POINTS_PER_CELL / len(coords)
+    return max(np.sqrt(width * height * per_point), max(width, height) * per_point, MIN_CELL_SIZE)
+
+
+def get_ranges(starts, ends):
+    # индексы всех отрезков [starts[i], ends[i]) подряд
+    lengths = ends - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum())
+
+
+class Grid:
+    """
+    Uniform grid over axis-aligned boxes (N, 4): x1, y1, x2, y2.
+    Every box is put in all cells it covers, keys of the cells are sorted,
+    so the cells of one grid row are found by one searchsorted.
+    """
+
+    def __init__(self, boxes, cell_size):
+        self.cell_size = cell_size
+        self.origin = boxes[:, :2].min(axis=0) if len(boxes) else np.zeros(2)
+        cells = self.get_cells(boxes)
+        self.shape = cells[:, 2:].max(axis=0) + 1 if len(boxes) else np.ones(2, dtype=np.int64)
+        widths = cells[:, 2] - cells[:, 0] + 1
+        counts = widths * (cells[:, 3] - cells[:, 1] + 1)
+        large = counts > MAX_ITEM_CELLS
+        self.large = np.flatnonzero(large)
+
+        small = np.flatnonzero(~large)
+        counts = counts[small]
+        # по записи на каждую ячейку каждого элемента
+        items = np.repeat(small, counts)
+        offsets = get_ranges(np.zeros(len(small), dtype=np.int64), counts)
+        widths = np.repeat(widths[small], counts)
+        ix = np.repeat(cells[small, 0], counts) + offsets % widths
+        iy = np.repeat(cells[small, 1], counts) + offsets // widths
+        keys = iy * self.shape[0] + ix
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.items = items[order]
+
+    def get_cells(self, boxes):
+        return np.floor((boxes - np.tile(self.origin, 2)) / self.cell_size).astype(np.int64)
+
+    def query(self, box):
+        """
+        Sorted indexes of the boxes that may intersect box (x1, y1, x2, y2).
+        """
+        ix1, iy1, ix2, iy2 = self.get_cells(np.array([box], dtype=np.double))[0].tolist()
+        ix1, iy1 = max(ix1, 0), max(iy1, 0)
+        ix2, iy2 = min(ix2, int(self.shape[0]) - 1), min(iy2, int(self.shape[1]) - 1)
+        found = self.large
+        if ix1 <= ix2 and iy1 <= iy2:
+            rows = np.arange(iy1, iy2 + 1, dtype=np.int64) * self.shape[0]
+            starts = np.searchsorted(self.keys, rows + ix1)
+            ends = np.searchsorted(self.keys, rows + ix2, side='right')
+            found = np.concatenate([self.items[get_ranges(starts, ends)], found])
+        return np.unique(found)
+
+
+class SpatialIndex:
+    """
+    Points and line segments of the storage at the moment of building, copied: the index is a snapshot
+    that another thread may read while the storage changes.
+    get_spatial_index rebuilds it after the coordinates or the structure change.
+    """
+
+    def __init__(self, storage):
+        rows = storage.points.get_alive_rows()
+        self.point_ids = storage.points.row_ids[rows]
+        self.points = storage.points.coords[rows]
+        self.point_order = np.argsort(self.point_ids)
+        self.line_ids, self.line_point_ids, self.segments = storage.get_segments()
+        self.point_grid = Grid(np.hstack([self.points, self.points]), get_cell_size(self.points))
+
+        segment_boxes = np.hstack([self.segments.min(axis=1), self.segments.max(axis=1)])
+        # ячейка не меньше типичного отрезка, чтобы отрезок попадал в несколько ячеек
+        sides = (segment_boxes[:, 2:] - segment_boxes[:, :2]).max(axis=1)
+        cell_size = max(get_cell_size(self.segments.mean(axis=1)), float(np.median(sides)) if len(sides) else 0.)
+        self.segment_grid = Grid(segment_boxes, cell_size)
+
+    def get_coords(self, point_ids):
+        """
+        Coordinates (N, 2) of the points point_ids.
+        """
+        positions = np.searchsorted(self.point_ids, point_ids, sorter=self.point_order)
+        return self.points[self.point_order[np.minimum(positions, len(self.point_ids) - 1)]]
+
+    def nearest_point(self, x, y, radius):
+        """
+        Id of the nearest point not farther than radius or None.
+        """
+        candidates = self.point_grid.query((x - radius, y - radius, x + radius, y + radius))
+        if not len(candidates):
+            return None
+        distances = np.hypot(*(self.points[candidates] - (x, y)).T)
+        nearest = np.argmin(distances)
+        if distances[nearest] > radius:
+            return None
+        return int(self.point_ids[candidates[nearest]])
+
+    def nearest_segment(self, x, y, radius):
+        """
+        Id of the line with the nearest segment not farther than radius or None.
+        """
+        candidates = self.segment_grid.query((x - radius, y - radius, x + radius, y + radius))
+        if not len(candidates):
+            return None
+        start = self.segments[candidates, 0]
+        direction = self.segments[candidates, 1] - start
+        to_point = np.array([x, y]) - start
+        length2 = np.einsum('ij,ij->i', direction, direction)
+        t = np.clip(np.einsum('ij,ij->i', to_point, direction) / np.maximum(length2, np.finfo(float).tiny), 0., 1.)
+        distances = np.hypot(*(to_point - t[:, None] * direction).T)
+        nearest = np.argmin(distances)
+        if distances[nearest] > radius:
+            return None
+        return int(self.line_ids[candidates[nearest]])
+
+    def box(self, x1, y1, x2, y2):
+        """
+        Ids of the points inside the box and ids of the lines with both ends inside it.
+        """
+        x1, x2 = min(x1, x2), max(x1, x2)
+        y1, y2 = min(y1, y2), max(y1, y2)
+        points = self.point_grid.query((x1, y1, x2, y2))
+        coords = self.points[points]
+        inside = (coords[:, 0] >= x1) & (coords[:, 0] <= x2) & (coords[:, 1] >= y1) & (coords[:, 1] <= y2)
+        lines = self.segment_grid.query((x1, y1, x2, y2))
+        ends = self.segments[lines]
+        lines_inside = np.all((ends[..., 0] >= x1) & (ends[..., 0] <= x2) &
+                              (ends[..., 1] >= y1) & (ends[..., 1] <= y2), axis=1)
+        return self.point_ids[points[inside]].tolist(), self.line_ids[lines[lines_inside]].tolist()
+
+
+def get_spatial_index(storage):
+    # перестраивается при следующем запросе после любого изменения точек или линий
+    key = (storage.structure_version, storage.points.version)
+    cached = storage.solver_cache.get('spatial')
+    if cached is None or cached[0] != key:
+        cached = (key, SpatialIndex(storage))
+        storage.solver_cache['spatial'] = cached
+    return cached[1]
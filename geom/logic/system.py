@@ -0,0 +1,113 @@
+import numpy as np
+
+from logic.batch import get_jacobian_pattern, get_jf_func, get_residual_jf_func, get_residual_pattern, \
+    group_constraints
+from logic.linalg import AUTO
+
+# точка считается сдвинутой решением, если координата изменилась больше чем на столько
+CHANGE_TOL = 1e-9
+ERROR_INCONSISTENT = 'Ограничение не добавлено. Возможно, ограничения несовместимы!'
+
+
+class CompiledSystem:
+    """
+    Everything about the Newton system that does not change between iterations:
+    lambda offsets, point index mappings, constraint batches and the Jacobian pattern.
+    Built once per structure of the sketch and cached on the storage.
+
+    The coordinates vector is [lambdas, variables] (see batch.group_constraints),
+    the system solves for its first size values, the rest are constants.
+
+    constraint_ids: the subsystem to compile, all constraints of the storage by default
+    """
+
+    def __init__(self, storage, backend=AUTO, constraint_ids=None):
+        if constraint_ids is None:
+            constraint_ids = list(storage.constraints)
+        self.version = storage.structure_version
+        self.backend = backend
+        self.constraint_ids = constraint_ids
+        self.batches, self.lam_num, self.point_rows, self.coord_vars, self.var_num, self.var_fixed, \
+            point_weights = group_constraints(storage, constraint_ids)
+        # rows of the point store are valid until the structure changes, ids - always
+        self.point_ids = storage.points.row_ids[self.point_rows]
+        # первая координата (id точки, ось) каждой неизвестной, для тёплого старта
+        _, first = np.unique(self.coord_vars.ravel(), return_index=True)
+        self.var_coords = [(int(self.point_ids[i // 2]), int(i % 2)) for i in first[:self.var_num]]
+        # вес координаты - число ограничений на её точку, как если бы каждое ограничение добавляло
+        # своё перемещение точки: сумма w (z - c)^2 по координатам переменной z равна W (z - m)^2 + const,
+        # где W - сумма весов, m - взвешенное среднее, так что подстановка не меняет задачу
+        coord_weights = np.repeat(point_weights[:, None], 2, axis=1)
+        self.var_weights = np.bincount(self.coord_vars.ravel(), weights=coord_weights.ravel(),
+                                       minlength=len(self.var_fixed))[:self.var_num]
+        # значение закреплённой переменной задают только закреплённые точки
+        point_fixed = np.isin(self.point_ids, list(storage.constraints.linked.fixed))
+        self.coord_weights = np.where(self.var_fixed[self.coord_vars] & ~point_fixed[:, None], 0., coord_weights)
+        self.size = self.lam_num + self.var_num
+        self.pattern = get_jacobian_pattern(self.batches, self.lam_num, self.size, backend)
+        # шаблон grad(g) строится при первом решении без лямбд (newton.RESIDUAL_STRATEGIES)
+        self.residual_pattern = None
+
+    def get_var_coords(self, storage):
+        """
+        Value of every variable: the weighted mean of its coordinates (see coord_weights), for the fixed
+        ones - of the coordinates of the fixed points. The weighted mean is where the unsubstituted
+        system would move the tied coordinates, so the solution does not depend on substitution.
+        Fixed points tied with different values are inconsistent constraints.
+        """
+        coords = storage.points.coords[self.point_rows].ravel()
+        coord_vars = self.coord_vars.ravel()
+        weights = self.coord_weights.ravel()
+        sums = np.bincount(coord_vars, weights=coords * weights, minlength=len(self.var_fixed))
+        var_coords = sums / np.bincount(coord_vars, weights=weights, minlength=len(self.var_fixed))
+        if ((np.abs(coords - var_coords[coord_vars]) > CHANGE_TOL) & (weights > 0) & self.var_fixed[coord_vars]).any():
+            raise RuntimeError(ERROR_INCONSISTENT)
+        return var_coords
+
+    def get_coords(self, storage):
+        coords_vector = np.ones(self.lam_num + len(self.var_fixed))
+        # get current points position
+        coords_vector[self.lam_num:] = self.get_var_coords(storage)
+        return coords_vector
+
+    def get_start_delta_x(self):
+        start_delta_x = np.zeros(self.size)
+        start_delta_x[:self.lam_num] = 1.
+        return start_delta_x
+
+    def get_jf(self, coords_vector, delta_x, jacobian=True):
+        return get_jf_func(self.batches, coords_vector, self.pattern, delta_x, self.var_weights, jacobian)
+
+    def get_residual_jf(self, coords_vector, coord_delta, jacobian=True):
+        """
+        J, F of the formulation without lambdas: the unknowns are the var_num coordinates,
+        F - the constraint equations, J - their lam_num x var_num Jacobian.
+        """
+        if self.residual_pattern is None:
+            self.residual_pattern = get_residual_pattern(self.batches, self.lam_num, self.var_num, self.backend)
+        return get_residual_jf_func(self.batches, coords_vector, self.residual_pattern, coord_delta, jacobian)
+
+    def update_coords_in_storage(self, storage, coords_vector, delta_x):
+        """
+        Writes the solution coords_vector + delta_x to all points of the variables.
+        Returns the ids of the points that moved by more than CHANGE_TOL.
+        """
+        var_coords = coords_vector[self.lam_num:].copy()
+        var_coords[:self.var_num] += delta_x[self.lam_num:]
+        coords = var_coords[self.coord_vars]
+        changed = np.abs(coords - storage.points.coords[self.point_rows]).max(axis=1, initial=0.) > CHANGE_TOL
+        storage.points.set_rows_coords(self.point_rows, coords)
+        return self.point_ids[changed]
+
+
+def get_compiled_system(storage, backend=AUTO, constraint_ids=None):
+    systems = storage.solver_cache.get('systems')
+    if systems is None or systems['version'] != storage.structure_version:
+        systems = {'version': storage.structure_version}
+        storage.solver_cache['systems'] = systems
+    key = (backend, None if constraint_ids is None else tuple(constraint_ids))
+    system = systems.get(key)
+    if system is None:
+        system = CompiledSystem(storage, backend, constraint_ids)
+        systems[key] = system
+    return system
@@ -0,0 +1,111 @@
+"""
+Solver telemetry. A monitor is any callable monitor(event, data), data is a dict of values:
+
+solve_start     components, point_ids - recalculate_point_positions started
+system          component, size, lam_num, nnz, density, backend - compiled system of a component
+iteration_start component, iteration
+iteration_end   component, iteration, accepted, residual_norm, step_norm,
+                assembly_s (time of the J and F evaluations), solve_s (the rest of the step - linear solves)
+newton_end      component, iterations, converged, residual_norm
+solve_end       seconds, converged, error; residual_norm of the best iterates if the solve was interrupted
+
+The solver checks only `monitor is not None`, so nothing is measured while telemetry is disabled.
+"""
+import logging
+import time
+from collections import deque
+
+SOLVE_START = 'solve_start'
+SYSTEM = 'system'
+ITERATION_START = 'iteration_start'
+ITERATION_END = 'iteration_end'
+NEWTON_END = 'newton_end'
+SOLVE_END = 'solve_end'
+
+RING_BUFFER_SIZE = 10000
+
+# монитор по умолчанию для recalculate_point_positions, например панель GUI
+_monitor = None
+
+
+def set_monitor(monitor):
+    global _monitor
+    _monitor = monitor
+
+
+def get_monitor():
+    return _monitor
+
+
+class LogMonitor:
+    """
+    Writes the events to a logger of the logging module.
+    """
+
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self.logger = logger or logging.getLogger('geom.solver')
+        self.level = level
+
+    def __call__(self, event, data):
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, '%s %s', event, data)
+
+
+class RingBuffer:
+    """
+    Keeps the last maxlen events as (time, event, data).
+    """
+
+    def __init__(self, maxlen=RING_BUFFER_SIZE):
+        self.records = deque(maxlen=maxlen)
+
+    def __call__(self, event, data):
+        self.records.append((time.time(), event, data))
+
+    def get_events(self, event=None):
+        return [data for _, name, data in list(self.records) if event is None or name == event]
+
+    def clear(self):
+        self.records.clear()
+
+
+class Fanout:
+    """
+    Sends every event to several monitors.
+    """
+
+    def __init__(self, *monitors):
+        self.monitors = monitors
+
+    def __call__(self, event, data):
+        for monitor in self.monitors:
+            monitor(event, data)
+
+
+class Tagged:
+    """
+    Adds fixed values (e.g. the component index) to every event.
+    """
+
+    def __init__(self, monitor, **tags):
+        self.monitor = monitor
+        self.tags = tags
+
+    def __call__(self, event, data):
+        self.monitor(event, dict(data, **self.tags))
+
+
+class TimedJF:
+    """
+    get_jf wrapper that sums the time of the J and F evaluations.
+    """
+
+    def __init__(self, get_jf):
+        self.get_jf = get_jf
+        self.seconds = 0.
+
+    def __call__(self, delta_x, jacobian=True):
+        start = time.perf_counter()
+        result = self.get_jf(delta_x, jacobian=jacobian)
+        self.seconds += time.perf_counter() - start
+        return result
@@ -0,0 +1,43 @@
+class WarmStart:
+    """
+    Converged lambdas (by constraint id) and displacements of the coordinates (by point id and axis)
+    of the previous solves, used as the initial guess of the next one. A lambda is used only while the value of
+    its constraint is the same.
+    """
+
+    def __init__(self):
+        self.lambdas = {}
+        self.coord_deltas = {}
+
+    def get_start_delta_x(self, system, extrapolate=False):
+        start_delta_x = system.get_start_delta_x()
+        for batch in system.batches:
+            for constraint_id, value, lam_indexes in zip(batch.constraint_ids, batch.values, batch.lam_indexes):
+                stored = self.lambdas.get(constraint_id)
+                if stored is not None and stored[0] == value:
+                    start_delta_x[lam_indexes] = stored[1]
+        if extrapolate:
+            # во время перетаскивания соседние решения почти одинаковы: повторяем прошлое смещение точек
+            for var, coord in enumerate(system.var_coords):
+                coord_delta = self.coord_deltas.get(coord)
+                if coord_delta is not None:
+                    start_delta_x[system.lam_num + var] = coord_delta
+        return start_delta_x
+
+    def store(self, system, delta_x):
+        for batch in system.batches:
+            for constraint_id, value, lam_indexes in zip(batch.constraint_ids, batch.values, batch.lam_indexes):
+                self.lambdas[constraint_id] = (value, delta_x[lam_indexes])
+        for var, coord in enumerate(system.var_coords):
+            self.coord_deltas[coord] = float(delta_x[system.lam_num + var])
+
+    def discard(self, constraint_id):
+        self.lambdas.pop(constraint_id, None)
+
+    def discard_point(self, point_id):
+        for axis in range(2):
+            self.coord_deltas.pop((point_id, axis), None)
+
+
+def get_warm_start(storage):
+    return storage.solver_cache.setdefault('warm_start', WarmStart())
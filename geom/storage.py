@@ -1,5 +1,363 @@
 from threading import Lock
 
+import numpy as np
+
+from constraint import CONSTRAINT_NAMES, FIX_POINT, LINEAR_CONSTRAINTS, LINKED_AXES, SYMMETRIC_CONSTRAINTS, Constraint
+
+# объекты ограничения
+NO_OBJECT = -1
+POINT = 0
+LINE = 1
+OBJECT_TYPES = {'point': POINT, 'line': LINE}
+MAX_OBJECTS = 3
+
+# доля удалённых строк, после которой таблицы уплотняются
+COMPACT_RATIO = 0.5
+
+
+class Table:
+    """
+    Columnar table: every column is a numpy array with one row per entity.
+    Ids are stable and never reused, id_to_row maps them to the current rows.
+    Deleted rows stay as holes until compact(), which keeps the order of the rows.
+
+    COLUMNS: name -> (row shape, dtype, fill value)
+    version grows on every change of the table, for caches of derived data
+    """
+    COLUMNS = {}
+    START_CAPACITY = 64
+
+    def __init__(self):
+        self.row_ids = np.full(self.START_CAPACITY, -1, dtype=np.int64)
+        for name, (shape, dtype, fill) in self.COLUMNS.items():
+            setattr(self, name, np.full((self.START_CAPACITY,) + shape, fill, dtype=dtype))
+        self.id_to_row = {}
+        self.size = 0
+        self.next_id = 0
+        self.version = 0
+
+    def add_row(self, **values):
+        if self.size == len(self.row_ids):
+            self.grow()
+        row = self.size
+        self.size += 1
+        for name, value in values.items():
+            getattr(self, name)[row] = value
+        row_id = self.next_id
+        self.next_id += 1
+        self.row_ids[row] = row_id
+        self.id_to_row[row_id] = row
+        self.version += 1
+        return row_id
+
+    def grow(self):
+        capacity = len(self.row_ids) * 2
+        for name, (shape, dtype, fill) in list(self.COLUMNS.items()) + [('row_ids', ((), np.int64, -1))]:
+            column = np.full((capacity,) + shape, fill, dtype=dtype)
+            column[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, column)
+
+    def remove(self, row_id):
+        row = self.get_row(row_id)
+        del self.id_to_row[row_id]
+        self.row_ids[row] = -1
+        self.version += 1
+
+    def get_row(self, row_id):
+        row = self.id_to_row.get(row_id)
+        if row is None:
+            raise KeyError(row_id)
+        return row
+
+    def get_rows(self, row_ids):
+        return np.array([self.get_row(row_id) for row_id in row_ids], dtype=np.int64)
+
+    def get_alive_rows(self):
+        return np.flatnonzero(self.row_ids[:self.size] >= 0)
+
+    def get_dead_num(self):
+        return self.size - len(self.id_to_row)
+
+    def compact(self):
+        """
+        Moves the alive rows to the beginning of the columns.
+        Returns old row -> new row (-1 for the deleted rows) to remap the references.
+        """
+        keep = self.get_alive_rows()
+        old_to_new = np.full(self.size, -1, dtype=np.int64)
+        old_to_new[keep] = np.arange(len(keep))
+        for name in list(self.COLUMNS) + ['row_ids']:
+            column = getattr(self, name)
+            column[:len(keep)] = column[keep]
+            column[len(keep):self.size] = self.COLUMNS[name][2] if name in self.COLUMNS else -1
+        self.size = len(keep)
+        self.id_to_row = {row_id: row for row, row_id in enumerate(self.row_ids[:self.size].tolist())}
+        self.version += 1
+        return old_to_new
+
+    def get_state(self):
+        """
+        Copy of the rows for set_state (transaction rollback).
+        """
+        state = {name: getattr(self, name).copy() for name in list(self.COLUMNS) + ['row_ids']}
+        state['id_to_row'] = dict(self.id_to_row)
+        state['size'] = self.size
+        return state
+
+    def set_state(self, state):
+        # next_id не восстанавливается: id удалённых откатом строк не используются повторно
+        for name in list(self.COLUMNS) + ['row_ids']:
+            setattr(self, name, state[name].copy())
+        self.id_to_row = dict(state['id_to_row'])
+        self.size = state['size']
+        self.version += 1
+
+    def __contains__(self, row_id):
+        return row_id in self.id_to_row
+
+    def __iter__(self):
+        # ids are added in increasing order and compact() keeps the order, so this is the row order
+        return iter(list(self.id_to_row))
+
+    def __len__(self):
+        return len(self.id_to_row)
+
+
+class PointStore(Table):
+    """
+    Coordinates of all points in one float64 array.
+    Qt point types are created from these coordinates only by the GUI.
+    """
+    COLUMNS = {'coords': ((2,), np.double, 0.)}
+
+    def add(self, x, y):
+        return self.add_row(coords=(x, y))
+
+    def set(self, point_id, x, y):
+        self.coords[self.get_row(point_id)] = (x, y)
+        self.version += 1
+
+    def move(self, point_id, dx, dy):
+        self.coords[self.get_row(point_id)] += (dx, dy)
+        self.version += 1
+
+    def get_coords(self, point_ids):
+        # (len(point_ids), 2) copy of the coordinates
+        return self.coords[self.get_rows(point_ids)]
+
+    def set_coords(self, point_ids, coords):
+        self.set_rows_coords(self.get_rows(point_ids), coords)
+
+    def set_rows_coords(self, rows, coords):
+        self.coords[rows] = coords
+        self.version += 1
+
+    def __getitem__(self, point_id):
+        return self.coords[self.get_row(point_id)].copy()
+
+    def items(self):
+        for point_id in self:
+            yield point_id, self[point_id]
+
+
+class LineStore(Table):
+    """
+    Lines as rows of their two points in the point store.
+    """
+    COLUMNS = {'points': ((2,), np.int64, -1)}
+
+    def __init__(self, point_store):
+        Table.__init__(self)
+        self.point_store = point_store
+
+    def add(self, p1_id, p2_id):
+        return self.add_row(points=self.point_store.get_rows([p1_id, p2_id]))
+
+    def get_point_ids(self, line_id):
+        p1_id, p2_id = self.point_store.row_ids[self.points[self.get_row(line_id)]].tolist()
+        return p1_id, p2_id
+
+    def pop(self, line_id):
+        line = self[line_id]
+        self.remove(line_id)
+        return line
+
+    def __getitem__(self, line_id):
+        p1_id, p2_id = self.get_point_ids(line_id)
+        return {'p1_id': p1_id, 'p2_id': p2_id}
+
+    def items(self):
+        for line_id in self:
+            yield line_id, self[line_id]
+
+
+class LinkedCoords:
+    """
+    Coordinates tied by the linear constraints (see constraint.LINEAR_CONSTRAINTS):
+    union-find over the coordinates (point id, axis) and the ids of the fixed points.
+    """
+
+    def __init__(self, parent=None, fixed=None):
+        self.parent = dict(parent or {})
+        self.fixed = set(fixed or ())
+
+    def find(self, coord):
+        root = self.parent.get(coord, coord)
+        while root != self.parent.get(root, root):
+            root = self.parent[root]
+        # сжатие путей
+        while coord != root:
+            self.parent[coord], coord = root, self.parent[coord]
+        return root
+
+    def union(self, coord_1, coord_2):
+        root_1 = self.find(coord_1)
+        root_2 = self.find(coord_2)
+        if root_1 != root_2:
+            self.parent[root_2] = root_1
+
+    def link(self, name, point_ids):
+        # point_ids - точки ограничения в порядке batch.get_point_rows
+        if name == FIX_POINT:
+            self.fixed.update(point_ids)
+            return
+        for axis in LINKED_AXES[name]:
+            self.union((point_ids[0], axis), (point_ids[1], axis))
+
+    def copy(self):
+        return LinkedCoords(self.parent, self.fixed)
+
+
+class ConstraintStore(Table):
+    """
+    Constraints as typed arrays: index of the name in CONSTRAINT_NAMES, value (nan if there is none)
+    and up to MAX_OBJECTS objects - their types and rows in the point or line store.
+    Line objects are stored before point objects, so all constraints of one kind have the same layout.
+    storage.constraints[id] builds a Constraint from these arrays.
+
+    Two indexes are kept up to date on add and remove:
+    by_object - (POINT or LINE, object id) -> ids of the constraints on the object,
+    by_key - canonical key (see get_key) -> constraint id, to find duplicates,
+    linked - LinkedCoords of the linear constraints.
+    """
+    COLUMNS = {
+        'kind': ((), np.int8, -1),
+        'value': ((), np.double, np.nan),
+        'object_types': ((MAX_OBJECTS,), np.int8, NO_OBJECT),
+        'objects': ((MAX_OBJECTS,), np.int64, -1),
+    }
+
+    def __init__(self, point_store, line_store):
+        Table.__init__(self)
+        self.stores = {POINT: point_store, LINE: line_store}
+        self.by_object = {}
+        self.by_key = {}
+        self.linked = LinkedCoords()
+
+    @staticmethod
+    def get_key(constraint):
+        objects = [(OBJECT_TYPES[obj['type']], obj['obj']) for obj in constraint.objects]
+        if constraint.name in SYMMETRIC_CONSTRAINTS:
+            objects.sort()
+        else:
+            objects.sort(key=lambda obj: obj[0] != LINE)
+        return constraint.name, tuple(objects)
+
+    def encode(self, constraint):
+        objects = sorted(constraint.objects, key=lambda obj: OBJECT_TYPES[obj['type']] != LINE)
+        object_types = np.full(MAX_OBJECTS, NO_OBJECT, dtype=np.int8)
+        rows = np.full(MAX_OBJECTS, -1, dtype=np.int64)
+        for i, obj in enumerate(objects):
+            object_types[i] = OBJECT_TYPES[obj['type']]
+            rows[i] = self.stores[OBJECT_TYPES[obj['type']]].get_row(obj['obj'])
+        return CONSTRAINT_NAMES.index(constraint.name), object_types, rows
+
+    def add(self, constraint):
+        kind, object_types, rows = self.encode(constraint)
+        value = np.nan if constraint.value is None else constraint.value
+        constraint_id = self.add_row(kind=kind, value=value, object_types=object_types, objects=rows)
+        key = self.get_key(constraint)
+        self.by_key[key] = constraint_id
+        for obj in set(key[1]):
+            self.by_object.setdefault(obj, set()).add(constraint_id)
+        if constraint.name in LINEAR_CONSTRAINTS:
+            self.linked.link(constraint.name, self.get_point_ids(key))
+        return constraint_id
+
+    def remove(self, constraint_id):
+        key = self.get_key(self[constraint_id])
+        Table.remove(self, constraint_id)
+        del self.by_key[key]
+        for obj in set(key[1]):
+            constraint_ids = self.by_object[obj]
+            constraint_ids.discard(constraint_id)
+            if not constraint_ids:
+                del self.by_object[obj]
+        if key[0] in LINEAR_CONSTRAINTS:
+            # union-find не умеет разделять классы, собираем заново из оставшихся линейных ограничений
+            self.linked = LinkedCoords()
+            for other_key in self.by_key:
+                if other_key[0] in LINEAR_CONSTRAINTS:
+                    self.linked.link(other_key[0], self.get_point_ids(other_key))
+
+    def get_point_ids(self, key):
+        # точки ограничения по ключу get_key: сначала концы отрезков, потом точки
+        point_ids = []
+        for obj_type, obj_id in key[1]:
+            if obj_type == LINE:
+                point_ids.extend(self.stores[LINE].get_point_ids(obj_id))
+            else:
+                point_ids.append(obj_id)
+        return point_ids
+
+    def get_state(self):
+        state = Table.get_state(self)
+        state['by_object'] = {obj: set(constraint_ids) for obj, constraint_ids in self.by_object.items()}
+        state['by_key'] = dict(self.by_key)
+        state['linked'] = self.linked.copy()
+        return state
+
+    def set_state(self, state):
+        Table.set_state(self, state)
+        self.by_object = {obj: set(constraint_ids) for obj, constraint_ids in state['by_object'].items()}
+        self.by_key = dict(state['by_key'])
+        self.linked = state['linked'].copy()
+
+    def find(self, constraint):
+        """
+        Id of the constraint with the same name and objects (in any order for SYMMETRIC_CONSTRAINTS) or None.
+        """
+        return self.by_key.get(self.get_key(constraint))
+
+    def get_by_object(self, obj_type, obj_id):
+        """
+        Sorted ids of the constraints on the point or the line.
+        """
+        return sorted(self.by_object.get((OBJECT_TYPES[obj_type], obj_id), ()))
+
+    def set_value(self, constraint_id, value):
+        self.value[self.get_row(constraint_id)] = np.nan if value is None else value
+
+    def pop(self, constraint_id):
+        constraint = self[constraint_id]
+        self.remove(constraint_id)
+        return constraint
+
+    def __getitem__(self, constraint_id):
+        row = self.get_row(constraint_id)
+        objects = []
+        for object_type, obj_row in zip(self.object_types[row].tolist(), self.objects[row].tolist()):
+            if object_type == NO_OBJECT:
+                break
+            objects.append({'type': 'line' if object_type == LINE else 'point',
+                            'obj': int(self.stores[object_type].row_ids[obj_row])})
+        value = self.value[row]
+        return Constraint(CONSTRAINT_NAMES[self.kind[row]], objects, None if np.isnan(value) else float(value))
+
+    def items(self):
+        for constraint_id in self:
+            yield constraint_id, self[constraint_id]
+
 
 class Storage(object):
     def __new__(cls, *args, **kwargs):
@@ -10,12 +368,53 @@ class Storage(object):
 
     def __init__(self):
         self.lock = Lock()
-        self.lines = {}
-        self.points = {}
-        self.constraints = {}
+        self.points = PointStore()
+        self.lines = LineStore(self.points)
+        self.constraints = ConstraintStore(self.points, self.lines)
 
         self.kv_storage_ = {}
 
+        # solver data derived from the structure of the sketch (see logic.system)
+        self.structure_version = 0
+        self.solver_cache = {}
+
+    def structure_changed(self):
+        self.structure_version += 1
+        # строки таблиц меняются только вместе с версией структуры, кэши решателя всё равно перестроятся
+        tables = (self.points, self.lines, self.constraints)
+        if any(table.get_dead_num() > COMPACT_RATIO * table.size for table in tables):
+            self.compact()
+
+    def get_state(self):
+        return {'points': self.points.get_state(), 'lines': self.lines.get_state(),
+                'constraints': self.constraints.get_state()}
+
+    def set_state(self, state):
+        self.points.set_state(state['points'])
+        self.lines.set_state(state['lines'])
+        self.constraints.set_state(state['constraints'])
+        self.structure_changed()
+
+    def compact(self):
+        points_map = self.points.compact()
+        lines_map = self.lines.compact()
+        constraints_map = self.constraints.compact()
+        lines = self.lines.points[:self.lines.size]
+        lines[...] = points_map[lines]
+        objects = self.constraints.objects[:self.constraints.size]
+        object_types = self.constraints.object_types[:self.constraints.size]
+        objects[object_types == POINT] = points_map[objects[object_types == POINT]]
+        objects[object_types == LINE] = lines_map[objects[object_types == LINE]]
+        return points_map, lines_map, constraints_map
+
+    def get_segments(self):
+        """
+        Ids of the lines, ids of their points (M, 2) and coordinates of the points (M, 2, 2).
+        """
+        rows = self.lines.get_alive_rows()
+        point_rows = self.lines.points[rows]
+        return self.lines.row_ids[rows], self.points.row_ids[point_rows], self.points.coords[point_rows]
+
     def get(self, key):
         if self.lock.locked():
             raise RuntimeError('storage is busy')
@@ -6,4 +6,10 @@ class Task:
 
 
 class TaskResult(Task):
-    pass
+    # drag - результат кадра перетаскивания: кадры не блокируют сцену и не снимают блокировку;
+    # index - logic.spatial.SpatialIndex эскиза после задачи, построенный в потоке логики:
+    # GUI берёт положения только из него, хранилище в это время меняет следующая задача
+    def __init__(self, name, params, error=None, drag=False, index=None):
+        Task.__init__(self, name, params, error)
+        self.drag = drag
+        self.index = index
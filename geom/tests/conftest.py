@@ -0,0 +1,12 @@
+import pytest
+
+
+# объекты ограничения в том виде, в каком их передаёт GUI
+@pytest.fixture
+def get_point():
+    return lambda point_id: {'type': 'point', 'obj': point_id}
+
+
+@pytest.fixture
+def get_line():
+    return lambda line_id: {'type': 'line', 'obj': line_id}
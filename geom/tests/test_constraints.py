@@ -0,0 +1,53 @@
+import numpy as np
+
+from benchmarks.generators import GENERATORS
+from logic.constraints import PARALLEL_THRESHOLD, get_parallel_groups
+from logic.linalg import DENSE, SPARSE
+from logic.sketch import Sketch
+from logic.system import CompiledSystem
+from storage import Storage
+
+
+class System:
+    def __init__(self, size):
+        self.size = size
+
+
+def test_parallel_groups():
+    sizes = [3, PARALLEL_THRESHOLD, 10, 2 * PARALLEL_THRESHOLD, 5]
+    assert get_parallel_groups([System(size) for size in sizes]) == [[1], [3], [0, 2, 4]]
+    # только маленькие системы - одна группа, пул не нужен
+    assert get_parallel_groups([System(3), System(4)]) == [[0, 1]]
+
+
+def test_parallel_solve_matches_sequential():
+    coords = []
+    for workers in (None, 1):
+        sketch = Sketch(Storage())
+        # большая цепочка и много маленьких компонент решётки
+        sketch.load(GENERATORS['chain'](1000))
+        sketch.load(GENERATORS['lattice'](100))
+        sketch.solve(workers=workers)
+        coords.append(sketch.storage.points.get_coords(list(sketch.storage.points)))
+    assert np.allclose(coords[0], coords[1])
+
+
+def test_sparse_jacobian_matches_dense():
+    sketch = Sketch(Storage())
+    sketch.load(GENERATORS['polygons'](24))
+    dense, sparse = (CompiledSystem(sketch.storage, backend) for backend in (DENSE, SPARSE))
+    coords = dense.get_coords(sketch.storage)
+    delta_x = dense.get_start_delta_x() + np.random.RandomState(0).uniform(-1., 1., dense.size)
+    dense_j, dense_f = dense.get_jf(coords, delta_x)
+    sparse_j, sparse_f = sparse.get_jf(coords, delta_x)
+    assert np.allclose(sparse_j.toarray(), dense_j) and np.allclose(sparse_f, dense_f)
+
+
+def test_sparse_solve_matches_dense():
+    coords = []
+    for backend in (DENSE, SPARSE):
+        sketch = Sketch(Storage())
+        sketch.load(GENERATORS['grid'](100))
+        sketch.solve(backend=backend)
+        coords.append(sketch.storage.points.get_coords(list(sketch.storage.points)))
+    assert np.allclose(coords[0], coords[1])
@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+
+from constraint import Constraint
+from logic.sketch import Sketch
+from storage import Storage
+
+
+@pytest.fixture
+def triangle(get_point):
+    sketch = Sketch(Storage())
+    lines = [sketch.add_line(0., 0., 10., 0.), sketch.add_line(10., 0., 5., 8.), sketch.add_line(5., 8., 0., 0.)]
+    for i, line in enumerate(lines):
+        sketch.add_constraint(Constraint('points_coincidence_constraint',
+                                         [get_point(line['p2_id']), get_point(lines[(i + 1) % 3]['p1_id'])]))
+    for line, length in zip(lines, (10., 9., 9.)):
+        sketch.add_constraint(Constraint('points_dist_constraint',
+                                         [get_point(line['p1_id']), get_point(line['p2_id'])], length))
+    return sketch, lines
+
+
+def test_free_line(get_point, get_line):
+    sketch = Sketch(Storage())
+    line = sketch.add_line(0., 0., 10., 0.)
+    dof = sketch.get_dof()
+    assert dof['dof'] == 4 and dof['lines'] == {line['line_id']: 4}
+    sketch.add_constraint(Constraint('horizontal_constraint', [get_line(line['line_id'])]))
+    sketch.add_constraint(Constraint('fix_point_constraint', [get_point(line['p1_id'])]))
+    dof = sketch.get_dof()
+    assert dof['dof'] == 1 and dof['points'] == {line['p1_id']: 0, line['p2_id']: 1}
+
+
+def test_rigid_triangle_and_redundant_angle(triangle, get_line):
+    sketch, lines = triangle
+    dof = sketch.get_dof()
+    assert dof['dof'] == 3 and dof['redundant_num'] == 0 and not dof['fully_defined']
+    # угол уже задан длинами сторон, решатель такое ограничение не добавит - кладём его в хранилище
+    sketch.storage.constraints.add(Constraint('angle_constraint', [get_line(lines[0]['line_id']),
+                                                                   get_line(lines[1]['line_id'])], 60.))
+    sketch.storage.structure_changed()
+    dof = sketch.get_dof()
+    assert dof['dof'] == 3 and dof['redundant_num'] == 1 and len(dof['redundant']) == 4
+
+
+def test_move_reuses_components(triangle):
+    sketch, lines = triangle
+    sketch.get_dof()
+    components = list(sketch.storage.solver_cache['dof'].values())
+    sketch.move_point(lines[0]['p1_id'], 1., 2.)
+    sketch.get_dof()
+    assert list(sketch.storage.solver_cache['dof'].values()) == components
+
+
+def test_cancelled_analysis_returns_none(triangle):
+    sketch, _ = triangle
+    cancel = threading.Event()
+    cancel.set()
+    assert sketch.get_dof(cancel=cancel) is None
+    assert sketch.get_dof()['dof'] == 3
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from logic.newton import DOGLEG, ERROR_STALLED, LEVENBERG_MARQUARDT, STRATEGIES, SolveCancelled, newtons_method
+
+DAMPED_STRATEGIES = (DOGLEG, LEVENBERG_MARQUARDT)
+
+
+def get_linear_jf(v, jacobian=True):
+    # 2x + y = 3, x + 3y = 4, решение (1, 1)
+    j_matrix = np.array([[2., 1.], [1., 3.]])
+    return j_matrix, j_matrix @ v - np.array([3., 4.])
+
+
+def get_empty_jf(v, jacobian=True):
+    return np.zeros((0, 0)), np.zeros(0)
+
+
+@pytest.mark.parametrize('strategy', DAMPED_STRATEGIES)
+def test_satisfied_system_converges_at_once(strategy):
+    events = []
+    result = newtons_method(get_linear_jf, [1., 1.], strategy=strategy,
+                            monitor=lambda event, data: events.append((event, data)))
+    assert np.allclose(result, [1., 1.])
+    assert events[-1][1]['converged'] and events[-1][1]['iterations'] == 0
+
+
+@pytest.mark.parametrize('strategy', DAMPED_STRATEGIES)
+def test_empty_system_converges(strategy):
+    assert newtons_method(get_empty_jf, [], strategy=strategy).shape == (0,)
+
+
+@pytest.mark.parametrize('strategy', DAMPED_STRATEGIES)
+def test_exact_step_converges(strategy):
+    # после точного шага F = 0, следующий шаг не должен отвергаться до DAMPED_MAX_ITER
+    assert np.allclose(newtons_method(get_linear_jf, [0., 0.], strategy=strategy), [1., 1.])
+
+
+@pytest.mark.parametrize('strategy', DAMPED_STRATEGIES)
+def test_inconsistent_system_stalls(strategy):
+    # x^2 + 1 = 0: минимум ||F|| = 1 в нуле, решения нет
+    def get_jf(v, jacobian=True):
+        return np.array([[2 * v[0]]]), np.array([v[0] ** 2 + 1])
+
+    with pytest.raises(RuntimeError, match=ERROR_STALLED):
+        newtons_method(get_jf, [0.7], strategy=strategy)
+
+
+@pytest.mark.parametrize('strategy', sorted(STRATEGIES))
+def test_deadline_returns_best_iterate(strategy):
+    # срок уже прошёл: ни одной итерации, лучшая итерация - начальное приближение
+    with pytest.raises(SolveCancelled) as info:
+        newtons_method(get_linear_jf, [0., 0.], strategy=strategy, deadline=0.)
+    assert np.allclose(info.value.delta_x, [0., 0.]) and np.isclose(info.value.residual_norm, 5.)
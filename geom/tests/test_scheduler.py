@@ -0,0 +1,68 @@
+from logic.scheduler import TaskScheduler
+from task import Task
+
+
+def test_full_queue_drops_task():
+    scheduler = TaskScheduler(maxlen=2)
+    assert scheduler.put(Task(name='add_line', params={}))
+    assert scheduler.put(Task(name='delete_line', params={'line_id': 0}))
+    assert not scheduler.put(Task(name='delete_line', params={'line_id': 1}))
+    assert len(scheduler) == 2
+
+
+def test_move_from_origin_replaces_queued_frames():
+    scheduler = TaskScheduler()
+    scheduler.put(Task(name='move_point', params={'point_id': 1, 'move_vector': 1., 'drag': True}))
+    scheduler.put(Task(name='move_point', params={'point_id': 1, 'move_vector': 5., 'origin': 0.}))
+    task, _ = scheduler.get()
+    assert task.params == {'point_id': 1, 'move_vector': 5., 'origin': 0.}
+
+
+def test_moves_of_same_object_coalesce():
+    scheduler = TaskScheduler(maxlen=2)
+    scheduler.put(Task(name='move_point', params={'point_id': 1, 'move_vector': 1.}))
+    scheduler.put(Task(name='move_point', params={'point_id': 1, 'move_vector': 2., 'drag': True}))
+    assert len(scheduler) == 1
+    scheduler.put(Task(name='move_point', params={'point_id': 2, 'move_vector': 4.}))
+    # очередь полна, но перемещение той же точки слот не занимает
+    assert scheduler.put(Task(name='move_point', params={'point_id': 2, 'move_vector': 8.}))
+    tasks = [scheduler.get()[0] for _ in range(2)]
+    assert [task.params for task in tasks] == [{'point_id': 1, 'move_vector': 3., 'drag': True},
+                                               {'point_id': 2, 'move_vector': 12.}]
+
+
+def test_only_last_task_coalesces():
+    scheduler = TaskScheduler()
+    scheduler.put(Task(name='move_point', params={'point_id': 1, 'move_vector': 1.}))
+    scheduler.put(Task(name='move_line', params={'line_id': 1, 'move_vector': 1.}))
+    # порядок задач сохраняется: перемещение точки после линии не сливается с первым
+    scheduler.put(Task(name='move_point', params={'point_id': 1, 'move_vector': 1.}))
+    assert len(scheduler) == 3
+
+
+def test_move_of_running_object_cancels_it():
+    scheduler = TaskScheduler()
+    scheduler.put(Task(name='move_point', params={'point_id': 1, 'move_vector': 1.}))
+    _, cancel = scheduler.get()
+    # кадр перетаскивания и перемещение другой точки не прерывают идущее решение
+    scheduler.put(Task(name='move_point', params={'point_id': 1, 'move_vector': 1., 'drag': True}))
+    scheduler.get()
+    scheduler.put(Task(name='move_point', params={'point_id': 2, 'move_vector': 1.}))
+    assert not cancel.is_set()
+    scheduler.done()
+    _, cancel = scheduler.get()
+    scheduler.put(Task(name='move_point', params={'point_id': 2, 'move_vector': 1.}))
+    assert cancel.is_set()
+
+
+def test_cancel_current():
+    scheduler = TaskScheduler()
+    scheduler.cancel_current()
+    scheduler.put(Task(name='add_line', params={}))
+    _, cancel = scheduler.get()
+    assert not cancel.is_set()
+    scheduler.cancel_current()
+    assert cancel.is_set()
+    scheduler.done()
+    scheduler.put(Task(name='add_line', params={}))
+    assert not scheduler.get()[1].is_set()
@@ -0,0 +1,189 @@
+import threading
+
+import numpy as np
+import pytest
+
+from constraint import Constraint
+from logic.newton import RESIDUAL_STRATEGIES, STRATEGIES, SolveCancelled
+from logic.sketch import Sketch
+from logic.telemetry import ITERATION_END, SOLVE_START
+from storage import Storage
+
+
+def get_coords(sketch):
+    return {point_id: tuple(coords) for point_id, coords in sketch.storage.points.items()}
+
+
+def test_add_constraint_cancelled_while_solving(get_point):
+    sketch = Sketch(Storage())
+    line = sketch.add_line(0., 0., 10., 3.)
+    coords = get_coords(sketch)
+    cancel = threading.Event()
+
+    # отмена приходит после первой итерации, как Esc во время решения
+    def monitor(event, data):
+        if event == ITERATION_END:
+            cancel.set()
+
+    with pytest.raises(SolveCancelled):
+        sketch.add_constraint(Constraint('points_dist_constraint', [get_point(line['p1_id']),
+                                                                    get_point(line['p2_id'])], 50.),
+                              cancel=cancel, monitor=monitor)
+    assert cancel.is_set()
+    assert len(sketch.storage.constraints) == 0
+    assert get_coords(sketch) == coords
+    assert sketch.transaction is None
+
+
+def test_add_constraint_cancel_keeps_old_value(get_point):
+    sketch = Sketch(Storage())
+    line = sketch.add_line(0., 0., 10., 0.)
+    objects = [get_point(line['p1_id']), get_point(line['p2_id'])]
+    constraint_id = sketch.add_constraint(Constraint('points_dist_constraint', objects, 20.))['constraint_id']
+    coords = get_coords(sketch)
+    cancel = threading.Event()
+    cancel.set()
+
+    with pytest.raises(SolveCancelled):
+        sketch.add_constraint(Constraint('points_dist_constraint', objects, 30.), cancel=cancel)
+    assert sketch.storage.constraints[constraint_id].value == 20.
+    assert get_coords(sketch) == coords
+
+
+def test_add_constraint_solves(get_line):
+    sketch = Sketch(Storage())
+    line = sketch.add_line(0., 0., 10., 3.)
+    result = sketch.add_constraint(Constraint('horizontal_constraint', [get_line(line['line_id'])]))
+    assert sorted(result['point_ids']) == sorted([line['p1_id'], line['p2_id']])
+    (_, y1), (_, y2) = sketch.storage.points.get_coords([line['p1_id'], line['p2_id']])
+    assert np.isclose(y1, y2)
+
+
+def test_inconsistent_move_restores_points(get_point, get_line):
+    sketch = Sketch(Storage())
+    line = sketch.add_line(0., 0., 10., 0.)
+    sketch.add_constraint(Constraint('horizontal_constraint', [get_line(line['line_id'])]))
+    sketch.add_constraint(Constraint('fix_point_constraint', [get_point(line['p1_id'])]))
+    sketch.add_constraint(Constraint('fix_point_constraint', [get_point(line['p2_id'])]))
+    coords = get_coords(sketch)
+
+    # закреплённые концы связаны по y, сдвиг одного из них по y несовместен
+    with pytest.raises(RuntimeError):
+        sketch.move_point(line['p1_id'], 0., 5.)
+    assert get_coords(sketch) == coords
+    # компонента после отвергнутого перемещения решается
+    sketch.solve()
+    assert sketch.get_dof()['fully_defined']
+
+
+def test_substitution_keeps_minimal_displacement(get_point, get_line):
+    # без подстановки линейных ограничений линия 6 становится вертикальной, линия 5 не стягивается в точку
+    sketch = Sketch(Storage())
+    line5 = sketch.add_line(0., 0., 10., 3.)
+    line6 = sketch.add_line(10., 3.2, 14., 9.)
+    sketch.add_constraint(Constraint('points_coincidence_constraint', [get_point(line5['p2_id']),
+                                                                       get_point(line6['p1_id'])]))
+    sketch.add_constraint(Constraint('horizontal_constraint', [get_line(line5['line_id'])]))
+    sketch.add_constraint(Constraint('perpendicular_constraint', [get_line(line5['line_id']),
+                                                                  get_line(line6['line_id'])]))
+    coords = sketch.storage.points.get_coords([line5['p1_id'], line5['p2_id'], line6['p1_id'], line6['p2_id']])
+    assert np.allclose(coords, [[0., 2.325], [32 / 3, 2.325], [32 / 3, 2.325], [32 / 3, 9.]])
+
+
+def test_coincidence_class_starts_at_weighted_mean(get_point):
+    # точка с расстоянием весит больше свободной, решение то же, что и без подстановки (082c667)
+    sketch = Sketch(Storage())
+    line1 = sketch.add_line(0., 0., 10., 3.)
+    line2 = sketch.add_line(10., 3.2, 14., 9.)
+    line3 = sketch.add_line(20., 0., 24., 1.)
+    sketch.add_constraint(Constraint('points_dist_constraint', [get_point(line1['p1_id']),
+                                                                get_point(line1['p2_id'])], 12.))
+    sketch.add_constraint(Constraint('points_coincidence_constraint', [get_point(line1['p2_id']),
+                                                                       get_point(line2['p1_id'])]))
+    sketch.add_constraint(Constraint('points_coincidence_constraint', [get_point(line2['p1_id']),
+                                                                       get_point(line3['p1_id'])]))
+    coords = sketch.storage.points.get_coords([line1['p1_id'], line1['p2_id'], line2['p1_id'], line3['p1_id']])
+    assert np.allclose(coords, [[0.4391, 0.0143], [12.1727, 2.5287], [12.1727, 2.5287], [12.1727, 2.5287]],
+                       atol=1e-4)
+
+
+@pytest.mark.parametrize('strategy', sorted(STRATEGIES))
+def test_strategies_converge_on_coupled_sketch(strategy, get_point, get_line):
+    sketch = Sketch(Storage())
+    line5 = sketch.add_line(0., 0., 10., 3.)
+    line6 = sketch.add_line(10., 3.2, 14., 9.)
+    for constraint in [Constraint('points_coincidence_constraint', [get_point(line5['p2_id']),
+                                                                    get_point(line6['p1_id'])]),
+                       Constraint('horizontal_constraint', [get_line(line5['line_id'])]),
+                       Constraint('perpendicular_constraint', [get_line(line5['line_id']),
+                                                               get_line(line6['line_id'])])]:
+        with sketch.batch(strategy=strategy):
+            sketch.add_constraint(constraint)
+    p10, p11, p12, p13 = sketch.storage.points.get_coords([line5['p1_id'], line5['p2_id'],
+                                                           line6['p1_id'], line6['p2_id']])
+    assert np.allclose(p11, p12) and np.isclose(p10[1], p11[1]) and np.isclose(p12[0], p13[0])
+    assert np.linalg.norm(p11 - p10) > 1. and np.linalg.norm(p13 - p12) > 1.
+    if strategy not in RESIDUAL_STRATEGIES:
+        # стратегии системы Лагранжа решают одну задачу и приходят в одну точку
+        assert np.allclose([p10, p11, p13], [[0., 2.325], [32 / 3, 2.325], [32 / 3, 9.]])
+
+
+def test_move_solves_only_its_component(get_point):
+    sketch = Sketch(Storage())
+    line1 = sketch.add_line(0., 0., 10., 0.)
+    line2 = sketch.add_line(0., 20., 10., 20.)
+    for line in (line1, line2):
+        sketch.add_constraint(Constraint('points_dist_constraint', [get_point(line['p1_id']),
+                                                                    get_point(line['p2_id'])], 10.))
+    # нарушенное ограничение второй линии: её компоненту перемещение первой не решает
+    sketch.storage.points.set_coords([line2['p2_id']], [[15., 20.]])
+    result = sketch.move_point(line1['p2_id'], 5., 0.)
+    assert set(result['point_ids']) <= {line1['p1_id'], line1['p2_id']}
+    assert np.allclose(sketch.storage.points.get_coords([line2['p2_id']]), [[15., 20.]])
+    p1, p2 = sketch.storage.points.get_coords([line1['p1_id'], line1['p2_id']])
+    assert np.isclose(np.linalg.norm(p2 - p1), 10.)
+    sketch.solve()
+    p1, p2 = sketch.storage.points.get_coords([line2['p1_id'], line2['p2_id']])
+    assert np.isclose(np.linalg.norm(p2 - p1), 10.)
+
+
+def test_batch_solves_once(get_point, get_line):
+    sketch = Sketch(Storage())
+    line = sketch.add_line(0., 0., 10., 3.)
+    starts = []
+
+    def monitor(event, data):
+        if event == SOLVE_START:
+            starts.append(data)
+
+    with sketch.batch(monitor=monitor) as result:
+        sketch.add_constraint(Constraint('horizontal_constraint', [get_line(line['line_id'])]))
+        sketch.add_constraint(Constraint('points_dist_constraint', [get_point(line['p1_id']),
+                                                                    get_point(line['p2_id'])], 20.))
+        # до конца транзакции точки не двигаются
+        assert np.allclose(sketch.storage.points.get_coords([line['p2_id']]), [[10., 3.]])
+    assert len(starts) == 1
+    assert set(result['point_ids']) == {line['p1_id'], line['p2_id']}
+    p1, p2 = sketch.storage.points.get_coords([line['p1_id'], line['p2_id']])
+    assert np.isclose(p1[1], p2[1]) and np.isclose(np.linalg.norm(p2 - p1), 20.)
+
+
+def test_batch_rolls_back(get_point):
+    sketch = Sketch(Storage())
+    line = sketch.add_line(0., 0., 10., 3.)
+    coords = get_coords(sketch)
+    with pytest.raises(ValueError):
+        with sketch.batch():
+            sketch.add_line(1., 1., 2., 2.)
+            sketch.move_point(line['p1_id'], 1., 1.)
+            raise ValueError
+    assert get_coords(sketch) == coords and len(sketch.storage.lines) == 1
+    # несовместная транзакция откатывается при решении в commit
+    with pytest.raises(RuntimeError):
+        with sketch.batch():
+            sketch.add_constraint(Constraint('points_coincidence_constraint', [get_point(line['p1_id']),
+                                                                               get_point(line['p2_id'])]))
+            sketch.add_constraint(Constraint('points_dist_constraint', [get_point(line['p1_id']),
+                                                                        get_point(line['p2_id'])], 10.))
+    assert get_coords(sketch) == coords and not len(sketch.storage.constraints)
+    assert sketch.transaction is None
@@ -0,0 +1,47 @@
+import numpy as np
+
+from logic.sketch import Sketch
+from logic.spatial import get_spatial_index
+from storage import Storage
+
+
+def test_index_is_snapshot():
+    sketch = Sketch(Storage())
+    line = sketch.add_line(0., 0., 10., 3.)
+    index = get_spatial_index(sketch.storage)
+    sketch.move_point(line['p2_id'], 5., 0.)
+    assert np.allclose(index.get_coords([line['p2_id'], line['p1_id']]), [[10., 3.], [0., 0.]])
+    assert np.allclose(get_spatial_index(sketch.storage).get_coords([line['p2_id']]), [[15., 3.]])
+
+
+def test_queries_match_brute_force():
+    sketch = Sketch(Storage())
+    random = np.random.RandomState(0)
+    for x1, y1, x2, y2 in random.uniform(0., 100., (200, 4)):
+        sketch.add_line(x1, y1, x2, y2)
+    # длинный отрезок через весь эскиз проверяется при каждом запросе, а не по ячейкам
+    long_line = sketch.add_line(-50., 50., 150., 51.)
+    index = get_spatial_index(sketch.storage)
+    point_ids = np.array(list(sketch.storage.points))
+    points = sketch.storage.points.get_coords(point_ids)
+    line_ids, _, segments = sketch.storage.get_segments()
+    for x, y in random.uniform(0., 100., (50, 2)):
+        distances = np.hypot(*(points - (x, y)).T)
+        nearest = index.nearest_point(x, y, 5.)
+        if distances.min() > 5.:
+            assert nearest is None
+        else:
+            assert nearest == point_ids[np.argmin(distances)]
+        direction = segments[:, 1] - segments[:, 0]
+        t = np.clip(np.einsum('ij,ij->i', (x, y) - segments[:, 0], direction) /
+                    np.einsum('ij,ij->i', direction, direction), 0., 1.)
+        distances = np.hypot(*((x, y) - segments[:, 0] - t[:, None] * direction).T)
+        nearest = index.nearest_segment(x, y, 2.)
+        assert nearest == (line_ids[np.argmin(distances)] if distances.min() <= 2. else None)
+    assert index.nearest_segment(-40., 50., 1.) == long_line['line_id']
+    inside_points, inside_lines = index.box(60., 20., 20., 80.)
+    inside = (points[:, 0] >= 20.) & (points[:, 0] <= 60.) & (points[:, 1] >= 20.) & (points[:, 1] <= 80.)
+    assert sorted(inside_points) == sorted(point_ids[inside].tolist())
+    ends_inside = np.all((segments[..., 0] >= 20.) & (segments[..., 0] <= 60.) &
+                         (segments[..., 1] >= 20.) & (segments[..., 1] <= 80.), axis=1)
+    assert sorted(inside_lines) == sorted(line_ids[ends_inside].tolist())
@@ -0,0 +1,52 @@
+import numpy as np
+
+from benchmarks.generators import GENERATORS
+from logic.sketch import Sketch
+from logic.system import get_compiled_system
+from logic.telemetry import NEWTON_END
+from logic.warm_start import get_warm_start
+from storage import Storage
+
+
+def drag(warm_start):
+    sketch = Sketch(Storage())
+    sketch.load(GENERATORS['polygons'](48))
+    sketch.solve()
+    iterations = []
+
+    def monitor(event, data):
+        if event == NEWTON_END:
+            iterations.append(data['iterations'])
+
+    for _ in range(5):
+        sketch.move_point(1, 0.5, -0.3, warm_start=warm_start, extrapolate=warm_start, monitor=monitor)
+    return iterations, sketch.storage.points.get_coords(list(sketch.storage.points))
+
+
+def test_drag_from_previous_solution():
+    warm_iterations, warm_coords = drag(True)
+    cold_iterations, cold_coords = drag(False)
+    assert np.allclose(warm_coords, cold_coords)
+    # первый кадр повторять нечего, дальше прошлое смещение почти точное
+    assert sum(warm_iterations[1:]) < sum(cold_iterations[1:])
+
+
+def test_lambdas_kept_only_for_same_value():
+    sketch = Sketch(Storage())
+    sketch.load(GENERATORS['chain'](8))
+    sketch.solve()
+    system = get_compiled_system(sketch.storage)
+    cache = get_warm_start(sketch.storage)
+    start_delta_x = cache.get_start_delta_x(system)
+    assert not np.allclose(start_delta_x[:system.lam_num], 1.)
+    # длины изменены в обход Sketch, который сам сбрасывает лямбды: кэш отличает их по значению
+    constraints = sketch.storage.constraints
+    lengths = [constraint_id for constraint_id in constraints if constraints[constraint_id].value]
+    for constraint_id in lengths:
+        constraints.set_value(constraint_id, constraints[constraint_id].value + 1.)
+    sketch.storage.structure_changed()
+    system = get_compiled_system(sketch.storage)
+    start_delta_x = cache.get_start_delta_x(system)
+    for batch in system.batches:
+        for constraint_id, lam_indexes in zip(batch.constraint_ids, batch.lam_indexes):
+            assert np.allclose(start_delta_x[lam_indexes], 1.) == (constraint_id in lengths)